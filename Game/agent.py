@@ -1,134 +1,428 @@
+import multiprocessing
 import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from abc import ABC, abstractmethod
 from Game.model import *
+from Game.transposition import *
+
+MATE = 10000
+MAX_PLY = 64
+ORDER_VALUES = (1, 3, 3, 5, 9, 100)  #Piece values by kind for MVV-LVA ordering
+DELTA_MARGIN = 200  #Positional swing a capture may bring on top of the piece it wins, for delta pruning
+
+
+class SearchTimeout(Exception):
+    '''
+    Raised inside a search once its time budget has run out.
+    '''
+    pass
+
 
 class Agent(ABC):
 
-    def __init__(self) -> None:
+    def __init__(self, depth) -> None:
         self.thread = None
+        self.depth = depth
+        self.deadline = None
+        self.nodes = 0
+        self.stats = []
+        self.root_best = NO_MOVE  #Best root move of the search running so far, played if depth 1 runs out of time
+        self.book = None  #Opening book consulted before searching, see Game/book.py
 
-    def get_action(self, model: Model, do_with):
-        self.thread = threading.Thread(target=self.do_get_action, args=(model, do_with))
+    def get_action(self, model: Model, do_with, time_budget=None):
+        '''
+        Call do_with(move) with the move to play. A book move is played at once,
+        otherwise the position is searched on a new thread.
+        '''
+        move = self.book.choose(model) if self.book is not None else NO_MOVE
+        if move != NO_MOVE:
+            do_with(move)
+            return
+        self.thread = threading.Thread(target=self.do_get_action, args=(model, do_with, time_budget))
         self.thread.start()
 
+    def do_get_action(self, model: Model, do_with, time_budget=None):
+        '''
+        Search the position and call do_with(move) with the move found.
+        '''
+        do_with(self.iterative_deepening(model, self.depth, time_budget))
+
     @abstractmethod
-    def do_get_action(self, model: Model, do_with):
+    def search(self, model: Model, depth: int) -> (int, float):
+        '''
+        Search the position to the given depth, returns the best move and its score.
+        '''
         pass
 
+    def iterative_deepening(self, model: Model, max_depth: int, time_budget=None) -> int:
+        '''
+        Search to depth 1, 2, ... max_depth and return the best move of the deepest search completed.
+        Given a time budget in seconds, the search running when it is spent is abandoned and the
+        model is restored. If even depth 1 runs out of time, the best root move it had found is
+        played, so there is always a move to play. stats collects (depth, nodes searched at that
+        depth, seconds since the start) per depth completed.
+        '''
+        start = time.monotonic()
+        undo_depth = len(model.undo_stack)
+        best_move = NO_MOVE
+        self.nodes = 0
+        self.stats = []
+        for depth in range(1, max_depth + 1):
+            if time_budget is not None:
+                if depth > 1 and time.monotonic() - start >= time_budget: break
+                self.deadline = start + time_budget
+            nodes = self.nodes
+            self.root_best = NO_MOVE
+            try:
+                best_move, _ = self.search(model, depth)
+            except SearchTimeout:
+                while len(model.undo_stack) > undo_depth: model.unmake_move()
+                if best_move == NO_MOVE:
+                    moves = self.get_moves(model)
+                    best_move = self.root_best if self.root_best != NO_MOVE or not moves else moves[0]
+                break
+            self.stats.append((depth, self.nodes - nodes, time.monotonic() - start))
+        self.deadline = None
+        return best_move
+
+    def close(self):
+        '''
+        Release anything the agent holds outside this process.
+        '''
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+
+    def check_time(self):
+        '''
+        Raise SearchTimeout once the deadline of the current search has passed.
+        '''
+        if self.deadline is not None and time.monotonic() >= self.deadline: raise SearchTimeout()
+
     def evaluate(self, model: Model) -> int:
         '''
-        Calculate and return a reward based on the cumulative value of live pieces.
-        Black is the maximizing player. Reward positive points for black pieces.
-        Reward negative points for white pieces.
-        '''
-        reward = 0
-        for row in model.board:
-            for piece in row:
-                if piece is None: continue
-
-                if isinstance(piece, King): temp_reward = 100
-                elif isinstance(piece, Queen): temp_reward = 10
-                elif isinstance(piece, Pawn): temp_reward = 1
-                elif isinstance(piece, Rook): temp_reward = 3
-                elif isinstance(piece, Knight): temp_reward = 3
-                elif isinstance(piece, Bishop): temp_reward = 3
-
-                if piece.color == BLACK: reward += temp_reward
-                else: reward -= temp_reward
-
-        return reward
-
-    def sim_move(self, old_model: Model, old_piece: Piece, location: (int, int)) -> list[list[Piece]]:
-        model = old_model.copy()
-        piece = model.get_piece((old_piece.row, old_piece.column))
-        other_piece = model.get_piece(location)
-
-        #Handle castling move
-        if len(location) == 3:
-            if isinstance(piece, King):
-                king = piece
-                rook = other_piece
-            else:
-                king = other_piece
-                rook = piece
-            model.set_piece(None, (king.row, king.column))
-            model.set_piece(king, (king.row, king.column + location[2]))
-            rook_step = 1 if location[2] < 0 else -1
-            model.set_piece(None, (rook.row, rook.column))
-            model.set_piece(rook, (king.row, king.column + rook_step))
-            king.has_moved = True
-            rook.has_moved = True
-
-        #Normal move
-        else:
+        Returns the material and piece-square score of the position in centipawns.
+        Black is the maximizing player, positive scores favour black.
+        The position keeps the score up to date as pieces move, so this costs the same at every leaf.
+        '''
+        return -model.position.evaluate()
 
-            #Add piece to be removed to the pieces lost dict
-            if other_piece:
-                other_piece.remove_from_color_list()
-                piece_name = type(other_piece).__name__ + "s"
-                model.pieces_lost[other_piece.color][piece_name] += 1
-
-            #Move piece
-            model.set_piece(None, (piece.row, piece.column))
-            model.set_piece(piece, location)
-            piece.has_moved = True
-
-        # pass turn
-        if model.turn == BLACK:
-            model.turn = WHITE
-            king = model.white_king
-        else:
-            model.turn = BLACK
-            king = model.black_king
 
-        return model
+    def quiescence(self, model: Model, alpha: int, beta: int, ply: int) -> int:
+        '''
+        Search captures only until the position is quiet, so no leaf is scored halfway through an
+        exchange. Scores are from the point of view of the side to move. The side to move may stand
+        pat on the static score. Captures that lose material by static exchange evaluation are skipped,
+        and so are captures that could not raise the score to alpha even winning the piece for free (delta pruning).
+        '''
+        self.nodes += 1
+        self.check_time()
+        position = model.position
+        stand_pat = position.evaluate() if model.turn == WHITE else -position.evaluate()
+        if stand_pat >= beta or ply >= MAX_PLY: return stand_pat
+        if stand_pat > alpha: alpha = stand_pat
+
+        squares = position.squares
+        captures = []
+        for move in self.get_moves(model):
+            if not move & CAPTURE_BIT: continue
+            victim = squares[move >> 6 & 63]
+            value = SEE_VALUES[PAWN if victim is None else victim % 6]  #No victim on the square is en passant
+            if stand_pat + value + DELTA_MARGIN <= alpha or position.see(move) < 0: continue
+            captures.append((value - ORDER_VALUES[squares[move & 63] % 6], move))
+        captures.sort(reverse=True)
 
+        for _, move in captures:
+            model.make_move(move)
+            score = -self.quiescence(model, -beta, -alpha, ply + 1)
+            model.unmake_move()
+            if score >= beta: return score
+            if score > alpha: alpha = score
+        return alpha
+
+    def quiet_evaluate(self, model: Model) -> int:
+        '''
+        evaluate() plus the best recapture the side to move has on the square the last move landed on,
+        by static exchange evaluation. A bounded stand-in for quiescence() for searches that score
+        every leaf, it costs at most one move generation however tangled the position.
+        '''
+        position = model.position
+        score = self.evaluate(model)
+        if not position.history: return score
+        target = position.history[-1][0] >> 6 & 63
+        if not position.attackers(target, model.turn, position.occupied()): return score
+        gain = 0
+        for move in self.get_moves(model):
+            if move & CAPTURE_BIT and move >> 6 & 63 == target: gain = max(gain, position.see(move))
+        return score + gain if model.turn == BLACK else score - gain
 
-    def game_is_done(self, model: Model, turn: int) -> bool:
-        pieces = model.black_pieces if turn == BLACK else model.white_pieces
-        for piece in pieces:
-            if piece is None: continue
-            if len(piece.get_locations()) > 0: return False
-        return True
+    def get_moves(self, model: Model) -> list:
+        '''
+        Returns the legal moves the agent considers. Pawns always promote to a queen, like the
+        controller does for the agent's moves.
+        '''
+        return [move for move in model.get_legal_moves() if not move & PROMOTION_BIT or move >> 12 & 3 == QUEEN - 1]
 
 
 class ExpectimaxAgent(Agent):
 
-    def __init__(self, depth) -> None:
-        super().__init__()
-        self.depth = depth
+    def __init__(self, depth, tt_size=1 << 16) -> None:
+        super().__init__(depth)
+        self.table = TranspositionTable(tt_size)
+        self.root_depth = 0
+
+    def search(self, model: Model, depth: int) -> (int, float):
+        self.root_depth = depth
+        return self.expectimax(model, depth, BLACK)
 
-    def do_get_action(self, model: Model, do_with):
-        old, new, _ = self.expectimax(model, self.depth, BLACK)
-        do_with(old, new)
+    def expectimax(self, model: Model, ply: int, turn: int) -> (int, float):
+        self.nodes += 1
+        self.check_time()
 
-    def expectimax(self, model: Model, ply: int, turn: int) -> ((int, int), float):
+        # Known position, searched at least this deep before
+        key = model.get_hash()
+        entry = self.table.probe(key)
+        if entry is not None and entry[0] >= ply:
+            return (entry[3], entry[1])
 
-        # Base case
-        if ply == 0 or self.game_is_done(model, turn):
-            return (None, None, self.evaluate(model))
+        # Base case, a piece left hanging on the last move is recaptured before the position is scored
+        if ply == 0: return (NO_MOVE, self.quiet_evaluate(model))
+        moves = self.get_moves(model)
+        if len(moves) == 0:
+            return (NO_MOVE, self.evaluate(model))
 
         # If this is the maximizing agent (BLACK)
         if turn == BLACK:
-            maxAction = (None, None, float('-inf'))
-            for piece in model.black_pieces:
-                if piece is None: continue
-                for location in piece.get_locations():
-                    new_model = self.sim_move(model, piece, location)
-                    stateAction = self.expectimax(new_model, ply, WHITE)
-                    if stateAction[2] > maxAction[2]:
-                        maxAction = ((piece.row, piece.column), location, stateAction[2])
-                    del new_model
+            maxAction = (NO_MOVE, float('-inf'))
+            for move in moves:
+                model.make_move(move)
+                stateAction = self.expectimax(model, ply, WHITE)
+                model.unmake_move()
+                if stateAction[1] > maxAction[1]:
+                    maxAction = (move, stateAction[1])
+                    if ply == self.root_depth: self.root_best = move  #Only the root is a max node at this ply
+            self.table.store(key, ply, maxAction[1], EXACT, maxAction[0])
             return maxAction
 
         # If this is the minimizing agent (WHITE)
         else:
             total_reward = 0
-            count = 0
-            for piece in model.white_pieces:
-                if piece is None: continue
-                for location in piece.get_locations():
-                    new_model = self.sim_move(model, piece, location)
-                    total_reward += self.expectimax(new_model, ply - 1, BLACK)[2]
-                    count += 1
-                    del new_model
-            return (None, None, total_reward / count)
+            for move in moves:
+                model.make_move(move)
+                total_reward += self.expectimax(model, ply - 1, BLACK)[1]
+                model.unmake_move()
+            self.table.store(key, ply, total_reward / len(moves), EXACT, NO_MOVE)
+            return (NO_MOVE, total_reward / len(moves))
+
+
+class AlphaBetaAgent(Agent):
+    '''
+    Negamax alpha-beta search with principal variation search. Scores are from the point of view
+    of the side to move. Moves are tried in the order: transposition table move, captures by most
+    valuable victim / least valuable attacker, queen promotions, killer moves, then quiet moves
+    by their history heuristic score. Leaves are searched on by quiescence().
+    '''
+
+    def __init__(self, depth, tt_size=1 << 16, processes=0) -> None:
+        super().__init__(depth)
+        self.tt_size = tt_size
+        self.table = TranspositionTable(tt_size)
+        self.killers = [[NO_MOVE, NO_MOVE] for i in range(MAX_PLY)]
+        self.history = [0] * 4096  #Indexed by the from and to squares of a move, move & 0xfff
+        self.processes = processes
+        self.pool = None
+        self.root_scores = {}
+
+    def iterative_deepening(self, model: Model, max_depth: int, time_budget=None) -> int:
+        self.killers = [[NO_MOVE, NO_MOVE] for i in range(MAX_PLY)]
+        self.root_scores = {}
+        return super().iterative_deepening(model, max_depth, time_budget)
+
+    def close(self):
+        super().close()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def search(self, model: Model, depth: int) -> (int, int):
+        '''
+        Search the position to the given depth, returns the best move and its score.
+        '''
+        if self.processes > 1: return self.parallel_search(model, depth)
+        alpha = -MATE - 1
+        best_move = NO_MOVE
+        entry = self.table.probe(model.get_hash())
+        moves = self.order_moves(model, self.get_moves(model), 0, entry[3] if entry else NO_MOVE)
+        for i, move in enumerate(moves):
+            model.make_move(move)
+            if i == 0:
+                score = -self.negamax(model, depth - 1, -MATE - 1, -alpha, 1)
+            else:
+                score = -self.negamax(model, depth - 1, -alpha - 1, -alpha, 1)
+                if score > alpha: score = -self.negamax(model, depth - 1, -MATE - 1, -alpha, 1)
+            model.unmake_move()
+            if score > alpha:
+                alpha = score
+                best_move = move
+                self.root_best = move
+        self.table.store(model.get_hash(), depth, alpha, EXACT, best_move)
+        return best_move, alpha
+
+    def parallel_search(self, model: Model, depth: int) -> (int, int):
+        '''
+        Root-parallel search, young brothers wait. The first root move is searched on this thread
+        with a full window. The others then go to the worker processes with a null window around
+        its score, and only a move that fails high is searched again with an open window.
+        Workers are sent the packed position, never the model, and keep their own transposition
+        table between moves. Root moves are ordered by their score at the previous depth.
+        '''
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+        key = model.get_hash()
+        entry = self.table.probe(key)
+        moves = self.order_moves(model, self.get_moves(model), 0, entry[3] if entry else NO_MOVE)
+        if self.root_scores: moves.sort(key=lambda move: self.root_scores.get(move, -MATE - 1), reverse=True)
+        if not moves: return NO_MOVE, -MATE - 1
+
+        best_move = moves[0]
+        model.make_move(best_move)
+        alpha = -self.negamax(model, depth - 1, -MATE - 1, MATE + 1, 1)
+        model.unmake_move()
+        self.root_best = best_move
+        scores = {best_move: alpha}
+
+        data = model.position.pack()
+        window = alpha
+        futures = [self.pool.submit(search_root_move, data, move, depth, self.deadline, self.tt_size, window, window + 1)
+            for move in moves[1:]]
+        try:
+            for move, future in zip(moves[1:], futures):
+                score = self.root_result(future)
+                if score > window:
+                    score = self.root_result(self.pool.submit(search_root_move, data, move, depth, self.deadline,
+                        self.tt_size, alpha, MATE + 1))
+                scores[move] = score
+                if score > alpha:
+                    alpha = score
+                    best_move = move
+                    self.root_best = move
+        except SearchTimeout:
+            for future in futures: future.cancel()
+            raise
+        self.root_scores = scores
+        self.table.store(key, depth, alpha, EXACT, best_move)
+        return best_move, alpha
+
+    def root_result(self, future) -> int:
+        '''
+        Wait for a worker's score of a root move, raising SearchTimeout if it ran out of time.
+        '''
+        score, nodes = future.result()
+        self.nodes += nodes
+        if score is None: raise SearchTimeout()
+        return score
+
+    def negamax(self, model: Model, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        self.check_time()
+        if ply > 0 and model.is_repetition(): return 0
+
+        # Known position, use its stored bound
+        key = model.get_hash()
+        entry = self.table.probe(key)
+        tt_move = NO_MOVE
+        if entry is not None:
+            tt_move = entry[3]
+            if entry[0] >= depth:
+                value = entry[1]
+                if value > MATE - MAX_PLY: value -= ply
+                elif value < -MATE + MAX_PLY: value += ply
+                if entry[2] == EXACT: return value
+                if entry[2] == LOWER and value > alpha: alpha = value
+                elif entry[2] == UPPER and value < beta: beta = value
+                if alpha >= beta: return value
+
+        if depth <= 0: return self.quiescence(model, alpha, beta, ply)
+        moves = self.get_moves(model)
+        if len(moves) == 0:
+            return -MATE + ply if model.position.in_check() else 0
+
+        original_alpha = alpha
+        best_move = NO_MOVE
+        best_score = -MATE - 1
+        for i, move in enumerate(self.order_moves(model, moves, ply, tt_move)):
+            model.make_move(move)
+
+            # Principal variation search, prove the later moves are worse with a null window
+            if i == 0:
+                score = -self.negamax(model, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self.negamax(model, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta: score = -self.negamax(model, depth - 1, -beta, -alpha, ply + 1)
+            model.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha: alpha = score
+            if alpha >= beta:
+                if not move & CAPTURE_BIT:
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                    self.history[move & 0xfff] += depth * depth
+                break
+
+        if best_score <= original_alpha: flag = UPPER
+        elif best_score >= beta: flag = LOWER
+        else: flag = EXACT
+        value = best_score
+        if value > MATE - MAX_PLY: value += ply
+        elif value < -MATE + MAX_PLY: value -= ply
+        self.table.store(key, depth, value, flag, best_move)
+        return best_score
+
+    def order_moves(self, model: Model, moves: list, ply: int, tt_move=NO_MOVE) -> list:
+        '''
+        Sort the moves so the ones most likely to cause a cutoff are searched first.
+        '''
+        squares = model.position.squares
+        killers = self.killers[ply] if ply < MAX_PLY else (NO_MOVE, NO_MOVE)
+        scores = {}
+        for move in moves:
+            if move == tt_move: score = 1000000
+            elif move & CAPTURE_BIT:
+                victim = squares[move >> 6 & 63]
+                victim = PAWN if victim is None else victim % 6  #En passant
+                score = 100000 + ORDER_VALUES[victim] * 10 - ORDER_VALUES[squares[move & 63] % 6]
+            elif move & PROMOTION_BIT: score = 90000
+            elif move == killers[0]: score = 80000
+            elif move == killers[1]: score = 70000
+            else: score = self.history[move & 0xfff]
+            scores[move] = score
+        return sorted(moves, key=scores.__getitem__, reverse=True)
+
+
+_worker_agent = None
+
+
+def search_root_move(data: bytes, move: int, depth: int, deadline, tt_size: int, alpha: int, beta: int):
+    '''
+    Worker process side of AlphaBetaAgent.parallel_search. Unpacks the position, plays the root
+    move and searches the reply within the window (alpha, beta). Returns the move's score, or None
+    if the deadline passed first, and the nodes searched. The worker's agent and its transposition
+    table live as long as the worker process.
+    '''
+    global _worker_agent
+    if _worker_agent is None: _worker_agent = AlphaBetaAgent(depth, tt_size)
+    model = Model()
+    model.set_position(Position.unpack(data))
+    _worker_agent.deadline = deadline
+    _worker_agent.nodes = 0
+    model.make_move(move)
+    try:
+        return -_worker_agent.negamax(model, depth - 1, -beta, -alpha, 1), _worker_agent.nodes
+    except SearchTimeout:
+        return None, _worker_agent.nodes
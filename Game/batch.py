@@ -0,0 +1,68 @@
+from Game.evaluation import *
+
+try:
+    import numpy as np
+except ImportError:  #NumPy is only needed for batch evaluation
+    np = None
+
+EMPTY_CODE = 12  #Code of an empty square in an encoded board
+_TABLES = None
+
+
+def _require_numpy():
+    if np is None: raise ImportError("Batch evaluation needs NumPy, install it with 'pip install numpy'")
+
+
+def _tables() -> tuple:
+    '''
+    The score tables as arrays with an extra all zero row for EMPTY_CODE, built once.
+    '''
+    global _TABLES
+    if _TABLES is None:
+        _TABLES = (np.array(MG_SCORES + [[0] * 64], dtype=np.int32),
+            np.array(EG_SCORES + [[0] * 64], dtype=np.int32),
+            np.array(PHASES + (0,), dtype=np.int32))
+    return _TABLES
+
+
+def encode(positions) -> 'np.ndarray':
+    '''
+    Encode positions (or models) as an N x 64 int8 array of piece codes, EMPTY_CODE for an empty square.
+    '''
+    _require_numpy()
+    boards = np.full((len(positions), 64), EMPTY_CODE, dtype=np.int8)
+    for i, position in enumerate(positions):
+        squares = getattr(position, "position", position).squares
+        boards[i] = [EMPTY_CODE if code is None else code for code in squares]
+    return boards
+
+
+def to_planes(boards) -> 'np.ndarray':
+    '''
+    Convert N x 64 encoded boards to N x 12 x 64 one-hot planes, one plane per piece code.
+    '''
+    _require_numpy()
+    return (boards[:, None, :] == np.arange(12, dtype=np.int8)[None, :, None]).astype(np.int8)
+
+
+def evaluate_batch(boards) -> 'np.ndarray':
+    '''
+    Score many positions at once. boards is either N x 64 piece codes from encode() or N x 12 x 64
+    planes from to_planes(). Returns N scores in centipawns, positive when white is ahead,
+    the same as Position.evaluate() gives for each one.
+    '''
+    _require_numpy()
+    mg_scores, eg_scores, phases = _tables()
+    boards = np.asarray(boards)
+    if boards.ndim == 3:
+        mg = np.einsum('nps,ps->n', boards, mg_scores[:12], dtype=np.int64)
+        eg = np.einsum('nps,ps->n', boards, eg_scores[:12], dtype=np.int64)
+        phase = boards.sum(axis=2, dtype=np.int64) @ phases[:12]
+    else:
+        codes = boards.astype(np.intp)
+        squares = np.arange(64)
+        mg = mg_scores[codes, squares].sum(axis=1, dtype=np.int64)
+        eg = eg_scores[codes, squares].sum(axis=1, dtype=np.int64)
+        phase = phases[codes].sum(axis=1, dtype=np.int64)
+    phase = np.minimum(phase, MAX_PHASE)
+    return (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
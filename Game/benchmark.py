@@ -0,0 +1,141 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from Game.agent import *
+
+#Positions with the AI (black) to move, from the opening to the endgame
+BENCHMARK_POSITIONS = [
+    ("Open game", "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"),
+    ("Scholar's mate threat", "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR b KQkq - 4 4"),
+    ("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R b KQkq - 0 1"),
+    ("Middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 b - - 0 10"),
+    ("Rook endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 b - - 0 1"),
+    ("Promotion race", "7k/1P6/8/8/8/8/6p1/K7 b - - 0 1")
+]
+
+#Default depths keep a full run to a few minutes, expectimax has no pruning and grows ~100x per depth
+AGENTS = {
+    "alphabeta": (AlphaBetaAgent, [1, 2, 3, 4]),
+    "expectimax": (ExpectimaxAgent, [1])
+}
+
+
+def run_agent(agent_class, fen: str, depth: int, tt_size: int, trace_memory: bool, time_budget=None) -> dict:
+    '''
+    Search one position to one depth with a fresh agent through do_get_action, the same entry
+    point the controller uses, stopping early once any time budget in seconds is spent.
+    Returns the measurements for the run.
+    '''
+    agent = agent_class(depth, tt_size)
+    model = Model()
+    model.load_fen(fen)
+    played = []
+
+    if trace_memory: tracemalloc.start()
+    start = time.perf_counter()
+    agent.do_get_action(model, played.append, time_budget)
+    seconds = time.perf_counter() - start
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    #Effective branching factor, the growth in nodes from one depth to the next
+    depth_nodes = [nodes for _, nodes, _ in agent.stats]
+    branching = None
+    if len(depth_nodes) > 1 and depth_nodes[-2]: branching = depth_nodes[-1] / depth_nodes[-2]
+
+    return {
+        "move": move_name(played[0]),
+        "nodes": agent.nodes,
+        "seconds": seconds,
+        "nodes_per_second": agent.nodes / max(seconds, 1e-9),
+        "time_to_depth": [seconds_at for _, _, seconds_at in agent.stats],
+        "nodes_per_depth": depth_nodes,
+        "branching_factor": branching,
+        "peak_memory_bytes": peak_memory
+    }
+
+
+def run_benchmark(agent_names: list, depths=None, tt_size=1 << 16, trace_memory=False, time_budget=None) -> dict:
+    '''
+    Run every agent over every benchmark position at each depth. Timings come from an untraced
+    run, peak memory, when asked for, from a second run under tracemalloc, which slows Python
+    down too much to time. A time budget caps every run, the depth reached is then recorded.
+    '''
+    results = []
+    for name in agent_names:
+        agent_class, default_depths = AGENTS[name]
+        for position_name, fen in BENCHMARK_POSITIONS:
+            for depth in depths or default_depths:
+                result = run_agent(agent_class, fen, depth, tt_size, False, time_budget)
+                if trace_memory:
+                    result["peak_memory_bytes"] = run_agent(agent_class, fen, depth, tt_size, True, time_budget)["peak_memory_bytes"]
+                result.update({"agent": name, "position": position_name, "depth": depth,
+                    "depth_reached": len(result["nodes_per_depth"])})
+                results.append(result)
+                print(f"{name:<10} {position_name:<22} depth {depth}  {result['nodes']:>8} nodes  "
+                    f"{result['nodes_per_second']:>7.0f} nps  {result['seconds']:>7.3f}s")
+
+    return {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "tt_size": tt_size,
+        "time_budget": time_budget,
+        "results": results
+    }
+
+
+def get_commit():
+    '''
+    Returns the git commit the benchmark ran on, or None outside a git checkout.
+    '''
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: dict, new: dict):
+    '''
+    Print the change in nodes and speed of every run found in both benchmark results.
+    '''
+    old_runs = {(r["agent"], r["position"], r["depth"]): r for r in old["results"]}
+    for run in new["results"]:
+        key = (run["agent"], run["position"], run["depth"])
+        if key not in old_runs: continue
+        before = old_runs[key]
+        print(f"{key[0]:<10} {key[1]:<22} depth {key[2]}  nodes {run['nodes'] / max(before['nodes'], 1):>6.2f}x  "
+            f"time {run['seconds'] / max(before['seconds'], 1e-9):>6.2f}x")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the AI agents on a fixed set of positions.")
+    parser.add_argument("--agents", nargs="+", choices=list(AGENTS), default=list(AGENTS))
+    parser.add_argument("--depths", nargs="+", type=int, help="depths to search (default per agent)")
+    parser.add_argument("--tt-size", type=int, default=1 << 16, help="transposition table entries")
+    parser.add_argument("--memory", action="store_true", help="also measure peak memory, repeating every run under tracemalloc")
+    parser.add_argument("--time-budget", type=float, help="seconds each run may search for (default unlimited)")
+    parser.add_argument("--output", default="benchmark.json", help="file to write the results to")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.agents, args.depths, args.tt_size, args.memory, args.time_budget)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+from Game.position import *
+
+ROOK_DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+BISHOP_DIRECTIONS = [(-1, 1), (1, 1), (1, -1), (-1, -1)]
+KNIGHT_OFFSETS = [(2, -1), (2, 1), (1, -2), (1, 2), (-1, -2), (-1, 2), (-2, -1), (-2, 1)]
+KING_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def bitboard_locations(bitboard) -> list:
+    '''
+    Returns the (row, column) location of every set bit in the bitboard.
+    '''
+    locations = []
+    while bitboard:
+        bit = bitboard & -bitboard
+        square = bit.bit_length() - 1
+        locations.append((square >> 3, square & 7))
+        bitboard ^= bit
+    return locations
+
+
+def _leaper_attacks(row, column, offsets) -> int:
+    '''
+    Returns the bitboard of squares reached by single steps of the given offsets.
+    '''
+    attacks = 0
+    for i in offsets:
+        r, c = row + i[0], column + i[1]
+        if 0 <= r <= 7 and 0 <= c <= 7: attacks |= 1 << (r * 8 + c)
+    return attacks
+
+
+def _ray(row, column, direction) -> list:
+    '''
+    Returns the squares from (row, column) to the edge of the board in a direction, nearest first.
+    '''
+    ray = []
+    r, c = row + direction[0], column + direction[1]
+    while 0 <= r <= 7 and 0 <= c <= 7:
+        ray.append(r * 8 + c)
+        r, c = r + direction[0], c + direction[1]
+    return ray
+
+
+def _subsets(mask):
+    '''
+    Yield every subset of the bits in mask (Carry-Rippler enumeration).
+    '''
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask
+        if subset == 0: return
+
+
+def _slider_tables(directions) -> (list, list):
+    '''
+    Build the relevant occupancy mask and the attack table of a slider for every square.
+    The mask drops the last square of each ray, a blocker there never changes the attacks.
+    The table is keyed directly by the masked occupancy, so a lookup is a single dict
+    access, the same job a magic multiply and shift (or PEXT) does for an array.
+    '''
+    masks = []
+    tables = []
+    for sq in range(64):
+        ray_tables = []
+        mask = 0
+        for direction in directions:
+            ray = _ray(sq >> 3, sq & 7, direction)
+            ray_mask = 0
+            for i in ray[:-1]: ray_mask |= 1 << i
+
+            #Attacks along this ray for every blocker subset on it
+            ray_table = {}
+            for blockers in _subsets(ray_mask):
+                attacks = 0
+                for i in ray:
+                    attacks |= 1 << i
+                    if blockers >> i & 1: break
+                ray_table[blockers] = attacks
+            ray_tables.append((ray_mask, ray_table))
+            mask |= ray_mask
+
+        table = {}
+        for blockers in _subsets(mask):
+            attacks = 0
+            for ray_mask, ray_table in ray_tables: attacks |= ray_table[blockers & ray_mask]
+            table[blockers] = attacks
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+KNIGHT_ATTACKS = [_leaper_attacks(sq >> 3, sq & 7, KNIGHT_OFFSETS) for sq in range(64)]
+KING_ATTACKS = [_leaper_attacks(sq >> 3, sq & 7, KING_OFFSETS) for sq in range(64)]
+PAWN_ATTACKS = [
+    [_leaper_attacks(sq >> 3, sq & 7, [(1, -1), (1, 1)]) for sq in range(64)],    #BLACK
+    [_leaper_attacks(sq >> 3, sq & 7, [(-1, -1), (-1, 1)]) for sq in range(64)]   #WHITE
+]
+ROOK_MASKS, ROOK_TABLES = _slider_tables(ROOK_DIRECTIONS)
+BISHOP_MASKS, BISHOP_TABLES = _slider_tables(BISHOP_DIRECTIONS)
+ALL_SQUARES = (1 << 64) - 1
+
+
+def _line_tables() -> (list, list):
+    '''
+    BETWEEN[a][b] holds the squares strictly between two aligned squares,
+    LINE[a][b] holds the whole line through them. Both are empty when a and b are not aligned.
+    '''
+    between = [[0] * 64 for i in range(64)]
+    line = [[0] * 64 for i in range(64)]
+    for sq in range(64):
+        for direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            full = 1 << sq
+            for i in _ray(sq >> 3, sq & 7, direction) + _ray(sq >> 3, sq & 7, (-direction[0], -direction[1])):
+                full |= 1 << i
+            path = 0
+            for i in _ray(sq >> 3, sq & 7, direction):
+                between[sq][i] = path
+                line[sq][i] = full
+                path |= 1 << i
+    return between, line
+
+
+BETWEEN, LINE = _line_tables()
+
+#(right, king move, squares that must be empty, squares the king passes that must be safe)
+CASTLING_MOVES = [
+    [(BLACK_KINGSIDE, encode_move(4, 6, KING_CASTLE), 0x60, (5, 6)),
+        (BLACK_QUEENSIDE, encode_move(4, 2, QUEEN_CASTLE), 0xe, (3, 2))],
+    [(WHITE_KINGSIDE, encode_move(60, 62, KING_CASTLE), 0x60 << 56, (61, 62)),
+        (WHITE_QUEENSIDE, encode_move(60, 58, QUEEN_CASTLE), 0xe << 56, (59, 58))]
+]
+
+
+def rook_attacks(square, occupied) -> int:
+    return ROOK_TABLES[square][occupied & ROOK_MASKS[square]]
+
+
+def bishop_attacks(square, occupied) -> int:
+    return BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+
+
+def queen_attacks(square, occupied) -> int:
+    return (ROOK_TABLES[square][occupied & ROOK_MASKS[square]]
+        | BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]])
+
+
+class Position(BasePosition):
+    '''
+    Compact position core. Twelve bitboards, one per piece code (color * 6 + kind),
+    plus the occupancy of each color. squares mirrors the bitboards.
+    '''
+
+    __slots__ = ("bitboards", "occupancy")
+
+    def __init__(self):
+        super().__init__()
+        self.bitboards = [0] * 12
+        self.occupancy = [0, 0]
+
+
+    def copy(self) -> 'Position':
+        position = super().copy()
+        position.bitboards = self.bitboards[:]
+        position.occupancy = self.occupancy[:]
+        return position
+
+
+    def piece_bitboards(self) -> list:
+        return self.bitboards
+
+
+    def occupied(self) -> int:
+        '''
+        Returns a bitboard of every occupied square.
+        '''
+        return self.occupancy[BLACK] | self.occupancy[WHITE]
+
+
+    def put_piece(self, code, square):
+        '''
+        Place the piece code on an empty square.
+        '''
+        bit = 1 << square
+        self.bitboards[code] |= bit
+        self.occupancy[code // 6] |= bit
+        self.squares[square] = code
+        self.hash ^= ZOBRIST_PIECES[code][square]
+        self.mg_score += MG_SCORES[code][square]
+        self.eg_score += EG_SCORES[code][square]
+        self.phase += PHASES[code]
+
+
+    def remove_piece(self, square) -> int:
+        '''
+        Remove and return the piece code on the given square.
+        '''
+        code = self.squares[square]
+        bit = 1 << square
+        self.bitboards[code] ^= bit
+        self.occupancy[code // 6] ^= bit
+        self.squares[square] = None
+        self.hash ^= ZOBRIST_PIECES[code][square]
+        self.mg_score -= MG_SCORES[code][square]
+        self.eg_score -= EG_SCORES[code][square]
+        self.phase -= PHASES[code]
+        return code
+
+
+    def attackers(self, square, by_color, occupied) -> int:
+        '''
+        Returns a bitboard of the pieces of by_color attacking the square, sliders see through
+        anything missing from occupied. Works backwards from the square: a piece attacks it exactly
+        when that piece type, placed on the square, would attack the piece.
+        '''
+        bitboards = self.bitboards
+        base = by_color * 6
+        return ((PAWN_ATTACKS[by_color ^ 1][square] & bitboards[base + PAWN])
+            | (KNIGHT_ATTACKS[square] & bitboards[base + KNIGHT])
+            | (KING_ATTACKS[square] & bitboards[base + KING])
+            | (bishop_attacks(square, occupied) & (bitboards[base + BISHOP] | bitboards[base + QUEEN]))
+            | (rook_attacks(square, occupied) & (bitboards[base + ROOK] | bitboards[base + QUEEN])))
+
+
+    def is_square_attacked(self, square, by_color, occupied=None) -> bool:
+        '''
+        Returns true if a piece of by_color attacks the square.
+        '''
+        bitboards = self.bitboards
+        base = by_color * 6
+        if PAWN_ATTACKS[by_color ^ 1][square] & bitboards[base + PAWN]: return True
+        if KNIGHT_ATTACKS[square] & bitboards[base + KNIGHT]: return True
+        if KING_ATTACKS[square] & bitboards[base + KING]: return True
+        if occupied is None: occupied = self.occupancy[BLACK] | self.occupancy[WHITE]
+        if bishop_attacks(square, occupied) & (bitboards[base + BISHOP] | bitboards[base + QUEEN]): return True
+        return rook_attacks(square, occupied) & (bitboards[base + ROOK] | bitboards[base + QUEEN]) != 0
+
+
+    def king_square(self, color) -> int:
+        return self.bitboards[color * 6 + KING].bit_length() - 1
+
+
+    def generate_legal_moves(self) -> list:
+        '''
+        Returns every legal move for the side to move. Checking and pinned pieces are found once
+        up front, so each move is produced legal without being played on the board:
+        1. The king may step to any square the opponent does not attack once the king is lifted off the board
+        2. In double check only the king may move
+        3. In single check other pieces must capture the checker or block between it and the king
+        4. A pinned piece may only move along the line between its king and the pinning slider
+        5. En passant is tested against the sliders on the king's lines, the two pawns leave at once
+        '''
+        us = self.turn
+        them = us ^ 1
+        bitboards = self.bitboards
+        base = us * 6
+        enemy_base = them * 6
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = own | enemy
+        king = bitboards[base + KING].bit_length() - 1
+        moves = []
+
+        #King steps
+        without_king = occupied ^ (1 << king)
+        targets = KING_ATTACKS[king] & ~own
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            to = bit.bit_length() - 1
+            if not self.is_square_attacked(to, them, without_king):
+                moves.append(king | to << 6 | (CAPTURE_BIT if bit & enemy else 0))
+
+        checkers = self.attackers(king, them, occupied)
+        if checkers & (checkers - 1): return moves
+        if checkers: check_mask = checkers | BETWEEN[king][checkers.bit_length() - 1]
+        else: check_mask = ALL_SQUARES
+
+        #Pinned pieces, found by looking from the king through our own pieces at enemy sliders
+        enemy_diagonal = bitboards[enemy_base + BISHOP] | bitboards[enemy_base + QUEEN]
+        enemy_straight = bitboards[enemy_base + ROOK] | bitboards[enemy_base + QUEEN]
+        pinned = 0
+        snipers = (bishop_attacks(king, enemy) & enemy_diagonal) | (rook_attacks(king, enemy) & enemy_straight)
+        while snipers:
+            bit = snipers & -snipers
+            snipers ^= bit
+            blockers = BETWEEN[king][bit.bit_length() - 1] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own: pinned |= blockers
+
+        #Knights, bishops, rooks and queens
+        for kind in (KNIGHT, BISHOP, ROOK, QUEEN):
+            pieces = bitboards[base + kind]
+            while pieces:
+                bit = pieces & -pieces
+                pieces ^= bit
+                sq = bit.bit_length() - 1
+                if kind == KNIGHT:
+                    if bit & pinned: continue
+                    targets = KNIGHT_ATTACKS[sq]
+                elif kind == BISHOP: targets = bishop_attacks(sq, occupied)
+                elif kind == ROOK: targets = rook_attacks(sq, occupied)
+                else: targets = queen_attacks(sq, occupied)
+                targets &= ~own & check_mask
+                if bit & pinned: targets &= LINE[king][sq]
+                while targets:
+                    to_bit = targets & -targets
+                    targets ^= to_bit
+                    moves.append(sq | (to_bit.bit_length() - 1) << 6 | (CAPTURE_BIT if to_bit & enemy else 0))
+
+        #Pawns
+        step = 8 if us == BLACK else -8
+        start_row = 1 if us == BLACK else 6
+        pieces = bitboards[base + PAWN]
+        while pieces:
+            bit = pieces & -pieces
+            pieces ^= bit
+            sq = bit.bit_length() - 1
+            targets = PAWN_ATTACKS[us][sq] & enemy
+            push = 1 << (sq + step)
+            if not push & occupied:
+                targets |= push
+                if sq >> 3 == start_row and not (1 << (sq + step * 2)) & occupied: targets |= 1 << (sq + step * 2)
+            targets &= check_mask
+            if bit & pinned: targets &= LINE[king][sq]
+            while targets:
+                to_bit = targets & -targets
+                targets ^= to_bit
+                to = to_bit.bit_length() - 1
+                flags = CAPTURE if to_bit & enemy else (DOUBLE_PUSH if to - sq in (16, -16) else QUIET)
+                if to < 8 or to > 55:
+                    for promotion in PROMOTIONS: moves.append(sq | to << 6 | (PROMOTION | flags | promotion - 1) << 12)
+                else: moves.append(sq | to << 6 | flags << 12)
+
+        #En passant
+        ep = self.ep_square
+        if ep is not None:
+            captured = ep - step
+            if check_mask & ((1 << ep) | (1 << captured)):
+                pieces = PAWN_ATTACKS[them][ep] & bitboards[base + PAWN]
+                while pieces:
+                    bit = pieces & -pieces
+                    pieces ^= bit
+                    after = (occupied ^ bit ^ (1 << captured)) | (1 << ep)
+                    if (bishop_attacks(king, after) & enemy_diagonal) or (rook_attacks(king, after) & enemy_straight):
+                        continue
+                    moves.append(bit.bit_length() - 1 | ep << 6 | EN_PASSANT << 12)
+
+        #Castling
+        if not checkers:
+            for right, move, empty, path in CASTLING_MOVES[us]:
+                if (self.castling & right and not occupied & empty
+                and not self.is_square_attacked(path[0], them, occupied)
+                and not self.is_square_attacked(path[1], them, occupied)):
+                    moves.append(move)
+
+        return moves
@@ -0,0 +1,116 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+from Game.model import Model
+from Game.bitboard import NO_MOVE, move_name
+
+#Polyglot style entry: position key, move, weight, learn (unused), 16 bytes big endian.
+#Keys are the game's own Zobrist keys and moves its packed moves, so the format but not the
+#contents of Polyglot books carry over.
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+BOOK_PATH = os.path.join(os.path.dirname(__file__), "book.bin")
+OPENINGS_PATH = os.path.join(os.path.dirname(__file__), "openings.txt")
+
+
+class OpeningBook:
+    '''
+    Read only opening book, a file of entries sorted by position key. The file is memory mapped
+    and searched in place, so nothing is loaded until a position is looked up.
+    A missing or empty file gives an empty book.
+    '''
+
+    def __init__(self, path=BOOK_PATH):
+        self.file = None
+        self.data = None
+        self.size = 0
+        if os.path.exists(path) and os.path.getsize(path) >= ENTRY.size:
+            self.file = open(path, "rb")
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.size = len(self.data) // ENTRY.size
+
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+            self.data = None
+            self.file = None
+            self.size = 0
+
+
+    def lookup(self, key) -> list:
+        '''
+        Returns (move, weight) of every entry for the position key.
+        '''
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.data, middle * ENTRY.size)[0] < key: low = middle + 1
+            else: high = middle
+
+        entries = []
+        while low < self.size:
+            entry_key, move, weight, _ = ENTRY.unpack_from(self.data, low * ENTRY.size)
+            if entry_key != key: break
+            entries.append((move, weight))
+            low += 1
+        return entries
+
+
+    def choose(self, model: Model) -> int:
+        '''
+        Returns a book move for the model's position picked at random by weight, or NO_MOVE.
+        Entries that are not legal in the position, from a key collision, are ignored.
+        '''
+        if not self.size: return NO_MOVE
+        entries = self.lookup(model.get_hash())
+        if not entries: return NO_MOVE
+        legal = set(model.get_legal_moves())
+        entries = [(move, weight) for move, weight in entries if move in legal and weight > 0]
+        if not entries: return NO_MOVE
+        return random.choices([move for move, _ in entries], [weight for _, weight in entries])[0]
+
+
+def build_book(lines, path=BOOK_PATH, max_plies=20) -> int:
+    '''
+    Build a book file from games given as lines of moves in coordinate notation ('e2e4 e7e5 ...').
+    Every move of the first max_plies of each game is entered, weighted by how many games play it
+    in that position. Returns the number of entries written. Raises ValueError for an illegal move.
+    '''
+    counts = {}
+    for number, line in enumerate(lines, 1):
+        model = Model()
+        model.new_game()
+        for name in line.split()[:max_plies]:
+            moves = {move_name(move): move for move in model.get_legal_moves()}
+            if name not in moves: raise ValueError(f"Illegal move '{name}' in game {number}")
+            key = (model.get_hash(), moves[name])
+            counts[key] = counts.get(key, 0) + 1
+            model.make_move(moves[name])
+
+    entries = sorted(counts.items(), key=lambda item: (item[0][0], -item[1]))
+    with open(path, "wb") as file:
+        for (key, move), count in entries:
+            file.write(ENTRY.pack(key, move, min(count, 0xffff), 0))
+    return len(entries)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the AI's opening book from lines of coordinate moves.")
+    parser.add_argument("games", nargs="?", default=OPENINGS_PATH, help="text file, one game per line")
+    parser.add_argument("book", nargs="?", default=BOOK_PATH, help="book file to write")
+    parser.add_argument("--plies", type=int, default=20, help="moves of each game to enter (default 20)")
+    args = parser.parse_args(argv)
+
+    with open(args.games) as file:
+        lines = [line for line in file if line.strip() and not line.startswith("#")]
+    print(f"{build_book(lines, args.book, args.plies)} entries written to {args.book}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,14 +15,33 @@ class GameType(Enum):
     AI = 2
     NETWORK = 3
 
+class AgentType(Enum):
+    EXPECTIMAX = 1
+    ALPHA_BETA = 2
+
 class NetworkHost(Enum):
     SERVER = 1
     CLIENT = 2
 
 class NetworkIns(Enum):
+    HEARTBEAT = 0
     NEW_GAME = 1
     UPDATE_TIMER = 2
     MOVE_PIECE = 3
-    UPGRADE_PAWN = 4
     DECLARE_WINNER = 5
     REJOINED_LOBBY = 6
+    ASSIGN_COLOR = 7
+
+#Piece kinds, a piece code on the board is color * 6 + kind
+PAWN = 0
+KNIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+
+#Castling rights bit flags
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
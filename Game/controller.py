@@ -1,28 +1,49 @@
-from Game.model import Model
+from Game.model import Model, ModelObserver
 from Game.constants import *
 from Game.timer import Timer
+from Game.dispatch import Dispatcher
 from Game.network import *
 from Game.agent import *
+from Game.book import OpeningBook, BOOK_PATH
 
-class Controller:
+class Controller(ModelObserver):
 
     def __init__(self, app):
         self.view = app
         self.model = Model(self)
-        self.agent = ExpectimaxAgent(2)
         self.game_type = GameType(GameType.NONE.value)
         self.time_limit = 93  #Add 3 seconds to desired seconds to account for a timer buffer
-        self.timer = Timer(1, self.time_limit, func=self.view.update_timer, func_args=(WHITE,),
-            final_func=self.end_game, final_args=("Timer",))
+        self.tt_size = 1 << 16  #Entries in the AI's transposition table
+        self.agent_type = AgentType.ALPHA_BETA.value
+        self.agent_depth = 8  #Deepest the AI searches, time usually stops it first
+        self.agent_time_share = 0.1  #Share of the time left on the turn the AI may think for
+        self.agent_processes = 0  #Worker processes for a root-parallel AI search, 0 searches on the agent thread
+        self.book_path = BOOK_PATH  #Opening book the AI plays from before searching, None to always search
+        self.agent = self.create_agent()
+        self.dispatcher = Dispatcher()  #Calls from other threads waiting to run on the Tk thread
+        self.timer = Timer(1, self.time_limit, func=self.timer_tick, func_args=(WHITE,),
+            final_func=self.timer_ended)
         self.player_color = WHITE
-        self.selected_locations = []
+        self.selected_moves = {}
         self.piece_selected = None
-        self.pawn_to_upgrade = None
+        self.upgrade_kind = QUEEN
         self.online_player = None
         self.win_con = None
         self.win_color = None
 
 
+    def create_agent(self) -> Agent:
+        '''
+        Create the AI player selected by agent_type.
+        '''
+        if self.agent_type == AgentType.EXPECTIMAX.value:
+            agent = ExpectimaxAgent(self.agent_depth, self.tt_size)
+        else:
+            agent = AlphaBetaAgent(self.agent_depth, self.tt_size, self.agent_processes)
+        if self.book_path is not None: agent.book = OpeningBook(self.book_path)
+        return agent
+
+
     def new_game(self):
         '''
         Setup a new gameplay loop.
@@ -46,7 +67,7 @@ class Controller:
 
         else:
             self.timer.func_args=(WHITE,)
-            self.timer.final_func = self.end_game
+            self.timer.final_func = self.timer_ended
             self.timer.resume()
             if self.model.turn != self.player_color: self.agent_move()
 
@@ -65,14 +86,14 @@ class Controller:
         '''
         Called when a player has moved a piece, signaling the end of their turn.
         '''
-        self.model.pass_turn()
+        self.model.check_game_over()
         self.view.pass_turn(self.model.turn)
         if not self.view.popup_quit:
             self.timer.reset(new_args=(self.model.turn, ))
             self.timer.resume()
 
         if (self.game_type == GameType.AI.value
-        and self.model.turn != self.player_color):
+        and self.model.turn != self.player_color and self.model.result is None):
             self.agent_move()
 
 
@@ -89,7 +110,7 @@ class Controller:
         Deselect a piece that is highlighted on the board, forget the piece that is currently selected.
         '''
         self.piece_selected = None
-        self.selected_locations = []
+        self.selected_moves = {}
         self.view.remove_highlights()
 
 
@@ -105,27 +126,15 @@ class Controller:
 
         sel_location = (tile.row, tile.column)
         piece = self.model.get_piece(sel_location)
-        loc_in_selected = False
-
-        #Determine if location is in the selected locations list
-        #Set location to 'i' because 'i' might have a castling instruction
-        for i in self.selected_locations:
-            if (i[0], i[1]) == sel_location:
-                sel_location = i
-                loc_in_selected = True
 
         #Move a piece
-        if self.piece_selected and loc_in_selected:
-            old_location = (self.piece_selected.row, self.piece_selected.column)
-            self.perform_move(old_location, sel_location)
-
-            if self.model.check_pawn_end(self.piece_selected):
-                self.pawn_to_upgrade = self.piece_selected
-                self.view.get_upgrade_pawn(self.model.turn)  #This updates the tile the pawn moved to
-                self.send_ins(NetworkIns.UPGRADE_PAWN.value, old_location, sel_location)
-            else:
-                self.send_ins(NetworkIns.MOVE_PIECE.value, old_location, sel_location)
-
+        if self.piece_selected and sel_location in self.selected_moves:
+            move = self.selected_moves[sel_location]
+            if move_promotion(move):
+                self.view.get_upgrade_pawn(self.model.turn)  #Waits for upgrade_pawn() to get the user's choice
+                move = with_promotion(move, self.upgrade_kind)
+            self.perform_move(move)
+            self.send_ins(NetworkIns.MOVE_PIECE.value, move)
             self.clear_selection()
             self.pass_turn()
 
@@ -134,8 +143,8 @@ class Controller:
             self.clear_selection()
             self.view.highlight(tile, "blue")
             self.piece_selected = piece
-            self.selected_locations = piece.get_locations()
-            for loc in self.selected_locations:
+            self.selected_moves = piece.get_moves()
+            for loc in self.selected_moves:
                 self.view.highlight(self.view.get_tile(loc), "green")
 
         #Deselect piece
@@ -143,42 +152,53 @@ class Controller:
             self.clear_selection()
 
 
-    def perform_move(self, old_location, new_location):
+    def perform_move(self, move):
         '''
-        Moves the piece at old_location to new_location and update visuals
+        Play the move in the model and update visuals
         '''
-        piece = self.model.get_piece(old_location)
-        self.model.move_piece(piece, new_location)
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        flags = move >> 12
+        self.model.move_piece(move)
 
-        #Castling
-        if len(new_location) == 3:
-            for loc in [(piece.row, i) for i in range(0, 8)]:
-                p = self.model.get_piece(loc)
-                self.view.update_tile(loc, *self.get_image(p))
-
-        #Normal Move
+        #Castling moves the king and rook along the row
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE: locations = [(from_square >> 3, i) for i in range(8)]
         else:
-            self.view.update_tile(old_location, None, None)
-            self.view.update_tile(new_location, *self.get_image(piece))
+            locations = [location(from_square), location(to_square)]
+            if flags == EN_PASSANT: locations.append((from_square >> 3, to_square & 7))
+
+        for loc in locations:
+            self.view.update_tile(loc, *self.get_image(self.model.get_piece(loc)))
 
 
     def upgrade_pawn(self, new_type):
         '''
         Called from view, once the user has selected which piece the pawn should be upgraded to.
         '''
-        self.model.transform_pawn(self.pawn_to_upgrade, new_type)
-        loc = (self.pawn_to_upgrade.row, self.pawn_to_upgrade.column)
-        self.view.update_tile(loc, *self.get_image(self.model.get_piece(loc)))
-        self.pawn_to_upgrade = None
+        self.upgrade_kind = [piece_type.__name__ for piece_type in PIECE_TYPES].index(new_type)
 
 
     def update_lost_piece(self, color, piece_name, new_value):
         '''
-        Tells the view to update visuals for the pieces lost count
+        Tells the view to update visuals for the pieces lost count. Called by the model.
         '''
         self.view.update_pieces_lost(color, piece_name, new_value)
 
 
+    def timer_tick(self, color):
+        '''
+        Called by the timer thread every second. Only the latest pending update is drawn.
+        '''
+        self.dispatcher.post(self.view.update_timer, color, key="timer")
+
+
+    def timer_ended(self):
+        '''
+        Called by the timer thread when the turn's time is up.
+        '''
+        self.dispatcher.post(self.end_game, "Timer")
+
+
     def end_game(self, win_con, override_winner=None):
         '''
         Called by model, timer, and controller, when a player has won the game.
@@ -210,22 +230,34 @@ class Controller:
 
     def agent_move(self):
         '''
-        Gets the move from the AI on a seperate thread. Performs the move once
-        it has been calculated.
+        Gets the move from the AI on a seperate thread, or straight from its opening book.
+        Performs the move once it has been calculated.
         '''
         if self.agent.thread is not None: self.agent.thread.join()
-        self.agent.get_action(self.model.copy(), self.agent_do_move)
+        self.agent.get_action(self.model.copy(), self.agent_found_move, self.get_agent_time_budget())
+
+
+    def get_agent_time_budget(self) -> float:
+        '''
+        Seconds the AI may search for, a share of what is left on the turn timer.
+        '''
+        seconds_left = self.time_limit - 3 - self.timer.get_current_interval()
+        return max(seconds_left, 1) * self.agent_time_share
+
+
+    def agent_found_move(self, move):
+        '''
+        Called by self.agent when the best move has been calculated, on the agent's thread.
+        '''
+        self.dispatcher.post(self.agent_do_move, move)
 
 
-    def agent_do_move(self, old_location, new_location):
+    def agent_do_move(self, move):
         '''
-        Called by self.agent when the best move has been calculated.
+        Play the move the agent found, on the Tk thread. NO_MOVE, from a position with no legal moves, is ignored.
         '''
-        piece = self.model.get_piece(old_location)
-        self.perform_move(old_location, new_location)
-        if self.model.check_pawn_end(piece):
-            self.pawn_to_upgrade = piece
-            self.upgrade_pawn("Queen")
+        if move == NO_MOVE: return
+        self.perform_move(move)
         self.pass_turn()
 
 
@@ -252,10 +284,11 @@ class Controller:
             if isinstance(self.online_player.host, Server):
                 self.view.menu.update_connected(2, "Connecting...")
                 self.view.menu.start_button.configure(state="disabled")
-                self.send_ins(NetworkIns.REJOINED_LOBBY.value)
+                self.send_ins(NetworkIns.REJOINED_LOBBY.value, -1)
 
             elif isinstance(self.online_player.host, Client):
                 self.view.menu.update_connected(1, "Connecting...")
+                self.send_ins(NetworkIns.REJOINED_LOBBY.value, 1)
 
             self.view.hide_ingame_frame()
             self.view.show_menu_frame()
@@ -375,12 +408,8 @@ class Controller:
             elif value == NetworkIns.MOVE_PIECE.value:
                 self.online_player.send_as_bytes(value, self.timer.get_current_interval(), *args)
 
-            elif value == NetworkIns.UPGRADE_PAWN.value:
-                piece_type = type(self.model.get_piece(args[1])).__name__
-                self.online_player.send_as_bytes(value, self.timer.get_current_interval(), *args, piece_type)
-
             elif value == NetworkIns.DECLARE_WINNER.value:
-                self.online_player.send_as_bytes(value, self.timer.get_current_interval(), self.win_con, self.win_color)
+                self.online_player.send_as_bytes(value, self.timer.get_current_interval(), self.win_color, self.win_con)
 
             elif value == NetworkIns.REJOINED_LOBBY.value:
                 self.online_player.send_as_bytes(value, *args)
@@ -398,32 +427,33 @@ class Controller:
 
         elif data[0] == NetworkIns.MOVE_PIECE.value:
             self.update_network_timer(data[1])
-            self.perform_move((data[2], data[3]), tuple(data[4:])) #could be castling move, last tuple would be len 3
-            self.pass_turn()
-
-        elif data[0] == NetworkIns.UPGRADE_PAWN.value:
-            self.update_network_timer(data[1])
-            self.perform_move((data[2], data[3]), (data[4], data[5]))
-            self.pawn_to_upgrade = self.model.get_piece((data[4], data[5]))
-            self.upgrade_pawn(data[6])
+            self.perform_move(data[2])  #Packed move, promotions included
             self.pass_turn()
 
         elif data[0] == NetworkIns.DECLARE_WINNER.value:
             self.update_network_timer(data[1])
             self.view.update_timer(self.model.turn)
-            self.end_game(data[2], data[3])
+            self.end_game(data[3], data[2])
+
+        #A game server (Game/server.py) picks the client's color before each game
+        elif data[0] == NetworkIns.ASSIGN_COLOR.value:
+            self.player_color = data[1]
+            self.online_player.color = data[1]
+            self.set_lobby_both_connected()
 
-        #Server repeatedly says to client, "I'm in new lobby, are you in lobby?" until client in lobby or disconnects
+        #Server says to client, "I'm in new lobby, are you in lobby?" and the client answers.
+        #A client that was not in the lobby yet says so once it gets there, and the server acknowledges.
         elif data[0] == NetworkIns.REJOINED_LOBBY.value:
 
             if isinstance(self.online_player.host, Client):
-                in_lobby = 1 if self.view.active_frame == ActiveFrame.LOBBY.value else 0
-                self.send_ins(NetworkIns.REJOINED_LOBBY.value, in_lobby)
+                if data[1] == -1:
+                    in_lobby = 1 if self.view.active_frame == ActiveFrame.LOBBY.value else 0
+                    self.send_ins(NetworkIns.REJOINED_LOBBY.value, in_lobby)
                 self.set_lobby_both_connected()
 
             elif isinstance(self.online_player.host, Server):
-                if data[1] == 0:
-                    self.send_ins(NetworkIns.REJOINED_LOBBY.value)
-                elif data[1] == 1:
+                if data[1] == 1:
                     self.set_lobby_both_connected()
                     self.view.menu.start_button.configure(state="active")
+                    if self.view.active_frame == ActiveFrame.LOBBY.value:
+                        self.send_ins(NetworkIns.REJOINED_LOBBY.value, 1)
@@ -0,0 +1,48 @@
+import traceback
+from threading import Lock
+
+
+class Dispatcher:
+    '''
+    Calls made from the network, timer, and AI threads, queued to be run on the Tk thread.
+    The app drains the queue in batches from its main loop, so only the Tk thread touches widgets.
+    A call posted with a key replaces the pending call with the same key, so a burst of
+    updates to the same thing runs once, with the latest arguments.
+    '''
+
+    def __init__(self):
+        self.pending = []
+        self.keyed = {}
+        self.lock = Lock()
+
+
+    def post(self, func, *args, key=None):
+        '''
+        Queue func(*args) to run on the next drain, safe to call from any thread
+        '''
+        entry = [func, args]
+        with self.lock:
+            if key is not None:
+                previous = self.keyed.get(key)
+                if previous is not None: previous[0] = None
+                self.keyed[key] = entry
+            self.pending.append(entry)
+
+
+    def drain(self) -> int:
+        '''
+        Run every call posted so far in the order they were posted, returns how many ran.
+        Calls posted while draining wait for the next drain. A call that raises is reported
+        and the rest of the batch still runs.
+        '''
+        with self.lock:
+            pending, self.pending = self.pending, []
+            self.keyed = {}
+
+        count = 0
+        for func, args in pending:
+            if func is None: continue
+            try: func(*args)
+            except Exception: traceback.print_exc()
+            count += 1
+        return count
@@ -0,0 +1,240 @@
+from Game.position import *
+
+#The board is 10 columns by 12 rows, the 8x8 board framed by off-board sentinels two rows deep
+#at the top and bottom and one column deep at the sides, so no step ever leaves the array.
+EMPTY = 12
+OFFBOARD = 13
+MAILBOX = [21 + (sq >> 3) * 10 + (sq & 7) for sq in range(64)]  #Square to mailbox index
+SQUARES = [None] * 120  #Mailbox index to square
+for sq in range(64): SQUARES[MAILBOX[sq]] = sq
+
+KNIGHT_STEPS = (-21, -19, -12, -8, 8, 12, 19, 21)
+KING_STEPS = (-11, -10, -9, -1, 1, 9, 10, 11)
+ROOK_STEPS = (-10, -1, 1, 10)
+BISHOP_STEPS = (-11, -9, 9, 11)
+PAWN_STEPS = (10, -10)  #By color, black moves down the board
+PAWN_CAPTURE_STEPS = ((9, 11), (-11, -9))
+
+#(right, king move, squares that must be empty, squares the king passes that must be safe)
+MAILBOX_CASTLING_MOVES = [
+    [(BLACK_KINGSIDE, encode_move(4, 6, KING_CASTLE), (5, 6), (5, 6)),
+        (BLACK_QUEENSIDE, encode_move(4, 2, QUEEN_CASTLE), (1, 2, 3), (3, 2))],
+    [(WHITE_KINGSIDE, encode_move(60, 62, KING_CASTLE), (61, 62), (61, 62)),
+        (WHITE_QUEENSIDE, encode_move(60, 58, QUEEN_CASTLE), (57, 58, 59), (59, 58))]
+]
+
+
+class MailboxPosition(BasePosition):
+    '''
+    Position core on a 10x12 mailbox, a cheaper alternative to the bitboard Position with the same
+    interface. board is a bytearray of piece codes, EMPTY or OFFBOARD, so steps off the edge stop
+    on a sentinel instead of being range checked. pieces holds the squares of every piece code,
+    indexes the place of each square in its list, so pieces are added and removed in constant time.
+    Moves are generated pseudo-legal and kept when the king is safe after the move is tried on the board.
+    '''
+
+    __slots__ = ("board", "pieces", "indexes")
+
+    def __init__(self):
+        super().__init__()
+        self.board = bytearray([OFFBOARD]) * 120
+        for sq in range(64): self.board[MAILBOX[sq]] = EMPTY
+        self.pieces = [[] for code in range(12)]
+        self.indexes = [0] * 64
+
+
+    def copy(self) -> 'MailboxPosition':
+        position = super().copy()
+        position.board = self.board[:]
+        position.pieces = [squares[:] for squares in self.pieces]
+        position.indexes = self.indexes[:]
+        return position
+
+
+    def put_piece(self, code, square):
+        '''
+        Place the piece code on an empty square.
+        '''
+        squares = self.pieces[code]
+        self.indexes[square] = len(squares)
+        squares.append(square)
+        self.board[MAILBOX[square]] = code
+        self.squares[square] = code
+        self.hash ^= ZOBRIST_PIECES[code][square]
+        self.mg_score += MG_SCORES[code][square]
+        self.eg_score += EG_SCORES[code][square]
+        self.phase += PHASES[code]
+
+
+    def remove_piece(self, square) -> int:
+        '''
+        Remove and return the piece code on the given square. The last square in the piece's
+        list takes the removed square's place.
+        '''
+        code = self.squares[square]
+        squares = self.pieces[code]
+        last = squares.pop()
+        if last != square:
+            i = self.indexes[square]
+            squares[i] = last
+            self.indexes[last] = i
+        self.board[MAILBOX[square]] = EMPTY
+        self.squares[square] = None
+        self.hash ^= ZOBRIST_PIECES[code][square]
+        self.mg_score -= MG_SCORES[code][square]
+        self.eg_score -= EG_SCORES[code][square]
+        self.phase -= PHASES[code]
+        return code
+
+
+    def occupied(self) -> int:
+        '''
+        Returns a bitboard of every occupied square.
+        '''
+        occupied = 0
+        for code in range(12):
+            for sq in self.pieces[code]: occupied |= 1 << sq
+        return occupied
+
+
+    def attackers(self, square, by_color, occupied) -> int:
+        '''
+        Returns a bitboard of the pieces of by_color attacking the square, sliders see through
+        anything missing from occupied.
+        '''
+        board = self.board
+        index = MAILBOX[square]
+        base = by_color * 6
+        attackers = 0
+        for kind, steps in ((KNIGHT, KNIGHT_STEPS), (KING, KING_STEPS)):
+            for step in steps:
+                if board[index + step] == base + kind: attackers |= 1 << SQUARES[index + step]
+        for step in PAWN_CAPTURE_STEPS[by_color]:
+            if board[index - step] == base + PAWN: attackers |= 1 << SQUARES[index - step]
+        for kind, steps in ((ROOK, ROOK_STEPS), (BISHOP, BISHOP_STEPS)):
+            for step in steps:
+                target = index + step
+                while board[target] == EMPTY or board[target] != OFFBOARD and not occupied >> SQUARES[target] & 1:
+                    target += step
+                if board[target] == base + kind or board[target] == base + QUEEN: attackers |= 1 << SQUARES[target]
+        return attackers
+
+
+    def is_square_attacked(self, square, by_color) -> bool:
+        '''
+        Returns true if a piece of by_color attacks the square. Works backwards from the square:
+        a piece attacks it exactly when that piece type, standing on the square, would attack the piece.
+        '''
+        board = self.board
+        index = MAILBOX[square]
+        base = by_color * 6
+        pawn = base + PAWN
+        for step in PAWN_CAPTURE_STEPS[by_color]:
+            if board[index - step] == pawn: return True
+        knight = base + KNIGHT
+        for step in KNIGHT_STEPS:
+            if board[index + step] == knight: return True
+        king = base + KING
+        for step in KING_STEPS:
+            if board[index + step] == king: return True
+        queen = base + QUEEN
+        rook = base + ROOK
+        for step in ROOK_STEPS:
+            target = index + step
+            while board[target] == EMPTY: target += step
+            if board[target] == rook or board[target] == queen: return True
+        bishop = base + BISHOP
+        for step in BISHOP_STEPS:
+            target = index + step
+            while board[target] == EMPTY: target += step
+            if board[target] == bishop or board[target] == queen: return True
+        return False
+
+
+    def king_square(self, color) -> int:
+        return self.pieces[color * 6 + KING][0]
+
+
+    def generate_legal_moves(self) -> list:
+        '''
+        Returns every legal move for the side to move. Each pseudo-legal move is tried on the
+        board alone and kept if it leaves the king unattacked. Castling is checked up front.
+        '''
+        us = self.turn
+        them = us ^ 1
+        board = self.board
+        base = us * 6
+        pieces = self.pieces
+        targets = []  #Pseudo-legal (from index, to index, flags)
+
+        #Knights and kings step, captures are the codes of the other color
+        for kind, steps in ((KNIGHT, KNIGHT_STEPS), (KING, KING_STEPS)):
+            for sq in pieces[base + kind]:
+                index = MAILBOX[sq]
+                for step in steps:
+                    code = board[index + step]
+                    if code == EMPTY: targets.append((index, index + step, QUIET))
+                    elif code < EMPTY and code // 6 == them: targets.append((index, index + step, CAPTURE))
+
+        #Bishops, rooks and queens slide until something stops them
+        for kind, steps in ((BISHOP, BISHOP_STEPS), (ROOK, ROOK_STEPS), (QUEEN, KING_STEPS)):
+            for sq in pieces[base + kind]:
+                index = MAILBOX[sq]
+                for step in steps:
+                    target = index + step
+                    while board[target] == EMPTY:
+                        targets.append((index, target, QUIET))
+                        target += step
+                    code = board[target]
+                    if code < EMPTY and code // 6 == them: targets.append((index, target, CAPTURE))
+
+        #Pawns
+        forward = PAWN_STEPS[us]
+        start_row = 1 if us == BLACK else 6
+        ep_index = MAILBOX[self.ep_square] if self.ep_square is not None else None
+        for sq in pieces[base + PAWN]:
+            index = MAILBOX[sq]
+            if board[index + forward] == EMPTY:
+                targets.append((index, index + forward, QUIET))
+                if sq >> 3 == start_row and board[index + forward * 2] == EMPTY:
+                    targets.append((index, index + forward * 2, DOUBLE_PUSH))
+            for step in PAWN_CAPTURE_STEPS[us]:
+                code = board[index + step]
+                if code < EMPTY and code // 6 == them: targets.append((index, index + step, CAPTURE))
+                elif index + step == ep_index: targets.append((index, index + step, EN_PASSANT))
+
+        #Keep the moves that leave the king safe
+        moves = []
+        king = self.king_square(us)
+        pawn = base + PAWN
+        for index, target, flags in targets:
+            code = board[index]
+            captured = board[target]
+            board[index] = EMPTY
+            board[target] = code
+            ep_capture = None
+            if flags == EN_PASSANT:
+                ep_capture = target - forward
+                board[ep_capture] = EMPTY
+            from_square = SQUARES[index]
+            to_square = SQUARES[target]
+            safe = not self.is_square_attacked(to_square if from_square == king else king, them)
+            board[index] = code
+            board[target] = captured
+            if ep_capture is not None: board[ep_capture] = them * 6 + PAWN
+            if not safe: continue
+
+            if code == pawn and (to_square < 8 or to_square > 55):
+                for promotion in PROMOTIONS:
+                    moves.append(from_square | to_square << 6 | (PROMOTION | flags | promotion - 1) << 12)
+            else: moves.append(from_square | to_square << 6 | flags << 12)
+
+        #Castling
+        if self.castling and not self.is_square_attacked(king, them):
+            for right, move, empty, path in MAILBOX_CASTLING_MOVES[us]:
+                if (self.castling & right and all(board[MAILBOX[sq]] == EMPTY for sq in empty)
+                and not self.is_square_attacked(path[0], them)
+                and not self.is_square_attacked(path[1], them)):
+                    moves.append(move)
+
+        return moves
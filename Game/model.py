@@ -1,24 +1,52 @@
-from abc import ABC, abstractmethod
+from abc import ABC
 import copy
 from Game.constants import *
+from Game.bitboard import *
+
+class ModelObserver(ABC):
+    '''
+    Receives the events a game raises, attach one to a Model to follow the game.
+    A Model without an observer runs headless, for agents, analysis, self-play and servers.
+    '''
+
+    def update_lost_piece(self, color, piece_name, new_value):
+        '''
+        A piece of the given color was captured, new_value is how many of its kind are now lost.
+        '''
+        pass
+
+
+    def end_game(self, win_con, override_winner=None):
+        '''
+        The game ended by win_con, "Checkmate" or "Stalemate".
+        '''
+        pass
+
 
 class Model:
 
-    def __init__(self, controller):
-        self.controller = controller
+    def __init__(self, observer=None, position_type=Position):
+        self.observer = observer
+        self.position_type = position_type
+        self.result = None
         self.board = None
         self.pieces_lost = None
         self.black_king = None
         self.white_king = None
         self.black_pieces = None
         self.white_pieces = None
-        self.turn = WHITE
+        self.position = position_type()
+        self.undo_stack = []
+
+    @property
+    def turn(self) -> int:
+        return self.position.turn
 
     def copy(self) -> 'Model':
-        model = Model(None)
+        model = Model(None, self.position_type)
         model.board = []
-        model.black_pieces = []
-        model.white_pieces = []
+        model.black_pieces = PieceList()
+        model.white_pieces = PieceList()
 
         for row in self.board:
             new_row = []
@@ -28,21 +56,20 @@ class Model:
                     new_row.append(None)
                     continue
 
-                new_piece = piece.copy()
-                new_piece.model = model
+                new_piece = piece.copy(model)
                 new_row.append(new_piece)
                 # set king
                 if isinstance(new_piece, King):
                     if new_piece.color == BLACK: model.black_king = new_piece
                     else: model.white_king = new_piece
                 # add colors
-                if new_piece.color == BLACK: model.black_pieces.append(new_piece)
-                else: model.white_pieces.append(new_piece)
+                if new_piece.color == BLACK: model.black_pieces.add(new_piece)
+                else: model.white_pieces.add(new_piece)
 
             model.board.append(new_row)
 
         model.pieces_lost = copy.deepcopy(self.pieces_lost)
-        model.turn = self.turn
+        model.position = self.position.copy()
         return model
 
 
@@ -50,7 +77,6 @@ class Model:
         '''
         Start a new game. Update turn, board, pieces_lost.
         '''
-        self.turn = WHITE
         self.black_king = King(self, BLACK, 0, 4)
         self.white_king = King(self, WHITE, 7, 4)
         self.board = [
@@ -82,403 +108,316 @@ class Model:
             }
         }
         #Set black pieces list
-        self.black_pieces = []
+        self.black_pieces = PieceList()
         for row in self.board[:2]:
             for piece in row:
-                self.black_pieces.append(piece)
+                self.black_pieces.add(piece)
 
         #Set white pieces list
-        self.white_pieces = []
+        self.white_pieces = PieceList()
         for row in self.board[6:]:
             for piece in row:
-                self.white_pieces.append(piece)
+                self.white_pieces.add(piece)
 
+        self.load_position()
 
-    def get_piece(self, location) -> 'Piece':
+
+    def load_position(self):
         '''
-        Return the piece on the board at location (row, column).
+        Rebuild the bitboard position from the board, white to move with all castling rights.
         '''
-        return self.board[location[0]][location[1]]
+        self.position = self.position_type()
+        self.undo_stack = []
+        self.result = None
+        for row in self.board:
+            for piece in row:
+                if piece: self.position.put_piece(piece.color * 6 + piece.kind, piece.row * 8 + piece.column)
+        self.position.turn = WHITE
+        self.position.castling = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+        self.position.hash = self.position.compute_hash()
+
+
+    def set_position(self, position):
+        '''
+        Replace the game with the given position. Rebuilds the board, kings, color lists and
+        pieces lost from it. Pieces are marked as moved unless they could still be unmoved.
+        '''
+        self.position = position
+        self.undo_stack = []
+        self.result = None
+        self.board = [[None] * 8 for i in range(8)]
+        self.black_pieces = PieceList()
+        self.white_pieces = PieceList()
+        counts = {BLACK: [0] * 6, WHITE: [0] * 6}
+        unmoved = {4: BLACK_KINGSIDE | BLACK_QUEENSIDE, 0: BLACK_QUEENSIDE, 7: BLACK_KINGSIDE,
+            60: WHITE_KINGSIDE | WHITE_QUEENSIDE, 56: WHITE_QUEENSIDE, 63: WHITE_KINGSIDE}
+
+        for square in range(64):
+            code = position.squares[square]
+            if code is None: continue
+            color, kind = code // 6, code % 6
+            piece = PIECE_TYPES[kind](self, color, square >> 3, square & 7)
+            if kind == PAWN: piece.has_moved = piece.row != (1 if color == BLACK else 6)
+            elif kind in (KING, ROOK): piece.has_moved = not position.castling & unmoved.get(square, 0)
+            self.board[piece.row][piece.column] = piece
+            if kind == KING:
+                if color == BLACK: self.black_king = piece
+                else: self.white_king = piece
+            if color == BLACK: self.black_pieces.add(piece)
+            else: self.white_pieces.add(piece)
+            counts[color][kind] += 1
+
+        self.pieces_lost = {}
+        for color in (BLACK, WHITE):
+            self.pieces_lost[color] = {
+                "Pawns": max(8 - counts[color][PAWN], 0),
+                "Rooks": max(2 - counts[color][ROOK], 0),
+                "Knights": max(2 - counts[color][KNIGHT], 0),
+                "Bishops": max(2 - counts[color][BISHOP], 0),
+                "Queens": max(1 - counts[color][QUEEN], 0)
+            }
 
 
-    def set_piece(self, piece, location):
+    def load_fen(self, fen):
         '''
-        Assign given piece to given location (row, column).
+        Replace the game with the position given in Forsyth-Edwards Notation.
         '''
-        self.board[location[0]][location[1]] = piece
-        if piece:
-            piece.row = location[0]
-            piece.column = location[1]
+        self.set_position(self.position_type.from_fen(fen))
 
 
-    def move_piece(self, piece, location):
+    def get_hash(self) -> int:
         '''
-        Move the given piece to the given location on the board. Update pieces lost dict.
+        Returns the 64 bit Zobrist key of the position, updated incrementally with every move.
         '''
-        other_piece = self.get_piece(location)
-
-        #Handle castling move
-        if len(location) == 3:
-            if isinstance(piece, King):
-                king = piece
-                rook = other_piece
-            else:
-                king = other_piece
-                rook = piece
-            self.set_piece(None, (king.row, king.column))
-            self.set_piece(king, (king.row, king.column + location[2]))
-            rook_step = 1 if location[2] < 0 else -1
-            self.set_piece(None, (rook.row, rook.column))
-            self.set_piece(rook, (king.row, king.column + rook_step))
-            king.has_moved = True
-            rook.has_moved = True
+        return self.position.hash
 
-        #Normal move
-        else:
 
-            #Add piece to be removed to the pieces lost dict
-            if other_piece:
-                other_piece.remove_from_color_list()
-                piece_name = type(other_piece).__name__ + "s"
-                self.pieces_lost[other_piece.color][piece_name] += 1
-                self.controller.update_lost_piece(other_piece.color, piece_name,
-                    self.pieces_lost[other_piece.color][piece_name])
-
-            #Move piece
-            self.set_piece(None, (piece.row, piece.column))
-            self.set_piece(piece, location)
-            piece.has_moved = True
+    def is_repetition(self) -> bool:
+        '''
+        Returns true if the current position already occurred since the last capture or pawn move.
+        '''
+        return self.position.is_repetition()
 
 
-    def check_pawn_end(self, piece) -> bool:
+    def get_piece(self, location) -> 'Piece':
         '''
-        Returns true if pawn reached the edge of the board
+        Return the piece on the board at location (row, column).
         '''
-        if (isinstance(piece, Pawn) and piece.color == BLACK and piece.row == 7
-        or isinstance(piece, Pawn) and piece.color == WHITE and piece.row == 0):
-            return True
-        return False
+        return self.board[location[0]][location[1]]
 
 
-    def transform_pawn(self, piece, new_type):
+    def move_piece(self, move):
         '''
-        Place a new specified piece where a pawn stands
+        Play a move from get_legal_moves() in the game. Like make_move(), and counts the piece
+        captured in pieces lost and tells the observer.
         '''
-        if new_type == "Queen": new_piece = Queen(self, piece.color, piece.row, piece.column)
-        elif new_type == "Rook": new_piece = Rook(self, piece.color, piece.row, piece.column)
-        elif new_type == "Knight": new_piece = Knight(self, piece.color, piece.row, piece.column)
-        elif new_type == "Bishop": new_piece = Bishop(self, piece.color, piece.row, piece.column)
-        self.set_piece(new_piece, (piece.row, piece.column))
+        to_square = move >> 6 & 63
+        row = (move & 63) >> 3 if move >> 12 == EN_PASSANT else to_square >> 3  #En passant takes beside the pawn
+        other_piece = self.board[row][to_square & 7]
+        self.make_move(move)
 
-        #change piece in color list
-        color_list = self.black_pieces if piece.color == BLACK else self.white_pieces
-        for i in range(len(color_list)):
-            if color_list[i] == piece:
-                color_list[i] = new_piece
-                break
+        #Add the captured piece to the pieces lost dict
+        if other_piece:
+            piece_name = type(other_piece).__name__ + "s"
+            self.pieces_lost[other_piece.color][piece_name] += 1
+            if self.observer is not None: self.observer.update_lost_piece(other_piece.color, piece_name,
+                self.pieces_lost[other_piece.color][piece_name])
 
 
-    def pass_turn(self):
+    def make_move(self, move):
         '''
-        Pass turn to the next player, check for checkmate and stalemate.
+        Play a move from get_legal_moves() and pass the turn. Promotions take the move's promotion kind.
+        Records what unmake_move() needs on the undo stack. Unlike move_piece() the pieces lost are
+        left untouched and the observer is never told, this is the path the agents search with.
         '''
-        if self.turn == BLACK:
-            self.turn = WHITE
-            king = self.white_king
-        else:
-            self.turn = BLACK
-            king = self.black_king
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        flags = move >> 12
+        board = self.board
+        piece = board[from_square >> 3][from_square & 7]
+        captured = board[to_square >> 3][to_square & 7]
+        rook = None
 
-        #Count possible moves available
-        moves = []
-        for pieces in self.board:
-            for piece in pieces:
-                if piece and piece.color == self.turn:
-                    moves += piece.get_locations()
+        #En passant, the captured pawn stands beside the moving pawn
+        if flags == EN_PASSANT:
+            captured = board[from_square >> 3][to_square & 7]
+            board[captured.row][captured.column] = None
 
-        #If the player can't move, it's either checkmate or stalemate
-        if len(moves) == 0:
-            if king.in_check(): self.controller.end_game("Checkmate")
-            else: self.controller.end_game("Stalemate")
+        #Castling, bring the rook to the other side of the king
+        elif flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            rook_from, rook_to = (to_square + 1, to_square - 1) if flags == KING_CASTLE else (to_square - 2, to_square + 1)
+            rook = board[rook_from >> 3][rook_from & 7]
+            board[rook_from >> 3][rook_from & 7] = None
+            board[rook_to >> 3][rook_to & 7] = rook
+            rook.column = rook_to & 7
+            rook.has_moved = True
 
+        if captured: (self.black_pieces if captured.color == BLACK else self.white_pieces).remove(captured)
 
-class Piece(ABC):
-
-    def __init__(self, model, color, row, column):
-        self.model = model
-        self.color = color
-        self.row = row
-        self.column = column
-        self.has_moved = False
+        self.undo_stack.append((piece, captured, piece.has_moved, rook))
+        board[from_square >> 3][from_square & 7] = None
+        board[to_square >> 3][to_square & 7] = piece
+        piece.row = to_square >> 3
+        piece.column = to_square & 7
+        piece.has_moved = True
 
+        if flags & PROMOTION:
+            new_piece = PIECE_TYPES[(flags & 3) + 1](self, piece.color, piece.row, piece.column)
+            new_piece.has_moved = True
+            board[piece.row][piece.column] = new_piece
+            (self.black_pieces if piece.color == BLACK else self.white_pieces).replace(piece, new_piece)
 
-    def copy(self) -> 'Piece':
-        new_copy = type(self)(None, self.color, self.row, self.column)
-        new_copy.has_moved = self.has_moved
-        return new_copy
+        self.position.make_move(move)
 
 
-    def remove_from_color_list(self):
+    def unmake_move(self):
         '''
-        Removes this pieces from its color list, its no longer alive.
+        Take back the last move played with make_move().
         '''
-        color_list = self.model.black_pieces if self.color == BLACK else self.model.white_pieces
-        for i in range(len(color_list)):
-            if color_list[i] == self:
-                color_list[i] = None
-                break
+        piece, captured, has_moved, rook = self.undo_stack.pop()
+        move = self.position.history[-1][0]
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        self.position.unmake_move()
+        board = self.board
 
+        if move & PROMOTION_BIT:
+            color_list = self.black_pieces if piece.color == BLACK else self.white_pieces
+            color_list.replace(board[to_square >> 3][to_square & 7], piece)
 
-    @abstractmethod
-    def get_tentative(self) -> list:
-        '''
-        Returns a list of locations a piece can tentatively move to; list of tuple(row, column).
-        '''
-        pass
+        board[to_square >> 3][to_square & 7] = None
+        board[from_square >> 3][from_square & 7] = piece
+        piece.row = from_square >> 3
+        piece.column = from_square & 7
+        piece.has_moved = has_moved
 
+        if captured:
+            board[captured.row][captured.column] = captured
+            (self.black_pieces if captured.color == BLACK else self.white_pieces).add(captured)
 
-    def in_board_range(self, location) -> bool:
-        '''
-        Receives a tuple of 2 ints (row, column), returns true if the location is in range of the board list.
-        '''
-        return location[0] >= 0 and location[0] <= 7 and location[1] >= 0 and location[1] <= 7
+        if rook:
+            rook_from = to_square + 1 if to_square > from_square else to_square - 2
+            board[rook.row][rook.column] = None
+            board[rook_from >> 3][rook_from & 7] = rook
+            rook.column = rook_from & 7
+            rook.has_moved = False
 
 
-    def get_linear_tentative(self, pre_tentative) -> list:
+    def get_legal_moves(self) -> list:
         '''
-        Receive a list of semi-tentative locations this piece could move to and construct the true
-        tentative list. Basically casts a ray in a direction, adds locations to the list until
-        it hits another object. Allows the first tile hit belonging to the opposite color to be a
-        moveable location. While not allowing the first tile hit that belongs to this pieces color to
-        be a moveable location. This makes it easy to calculate the allowed locations for pieces that
-        work in a line-of-sight (queen, rook, bishop).
+        Returns every legal move for the player whose turn it is, as packed ints (see encode_move).
         '''
-        tentative = []
-        for t in pre_tentative:
-            for i in t:
-                if self.model.get_piece(i):
-                    if self.model.get_piece(i).color == self.color: break
-                    else:
-                        tentative.append(i)
-                        break
-                tentative.append(i)
-        return tentative
+        return self.position.generate_legal_moves()
 
 
-    def get_locations(self, tentative=None, first_call=True, castling=False) -> list:
+    def is_square_attacked(self, location, by_color) -> bool:
         '''
-        Search a list of tentative locations this piece can move to. Compile and return a new list
-        of locations after simulating each move and checking if it would leave the king in check.
-        first_call and castling are used to avoid recursion.
+        Returns true if a piece of by_color attacks the location (row, column).
         '''
-        if not tentative: tentative = self.get_tentative()
-        locations = []
-
-        for loc in tentative:
-
-            #Cant overtake a king
-            if first_call and (loc == (self.model.black_king.row, self.model.black_king.column)
-            or loc == (self.model.white_king.row, self.model.white_king.column)):
-                continue
-
-            #Save state
-            original_loc = (self.row, self.column)
-            org_piece = self.model.get_piece(loc)
-
-            #Simulate move
-            self.model.set_piece(None, (self.row, self.column))
-            self.model.set_piece(self, loc)
+        return self.position.is_square_attacked(location[0] * 8 + location[1], by_color)
 
-            #Check if king is in check
-            king = self.model.black_king if self.color == BLACK else self.model.white_king
-            if first_call:
-                if not king.in_check(): locations.append(loc)
-            else: locations.append(loc)
 
-            #Restore state
-            self.model.set_piece(org_piece, loc)
-            self.model.set_piece(self, original_loc)
-
-        if not castling and first_call and ((isinstance(self, King) or isinstance(self, Rook))):
-            locations += self.get_castling_locations()
-
-        return locations
-
-
-    def get_castling_locations(self) -> list:
+    def check_game_over(self):
         '''
-        Adds castling locations to the tentative list for rooks and kings.
-        Castling allows the king to move two spaces to the east or west
-        and the rook moves to the opposite side of the king from where it came.
-        Castling conditions:
-        1. Both the king and the rook must not have moved yet
-        2. There must not be any pieces in between the king and the rook
-        3. King cannot be in check
-        4. King cannot be in check after castling (this will be verified in the self.get_locations() call)
-        5. King cannot move through locations that would result in a check
+        Check the player to move for checkmate and stalemate, called once a move has been played.
+        The ending is kept in result for callers without an observer.
         '''
-        castling_locations = []
-        king = self.model.black_king if self.color == BLACK else self.model.white_king
+        king = self.white_king if self.turn == WHITE else self.black_king
 
-        #Verify king has not moved and is not in check
-        if king.has_moved or king.in_check(): return []
+        #If the player can't move, it's either checkmate or stalemate
+        if len(self.get_legal_moves()) == 0:
+            self.result = "Checkmate" if king.in_check() else "Stalemate"
+            if self.observer is not None: self.observer.end_game(self.result)
 
-        #Left rook
-        rook = self.model.get_piece((king.row, king.column-4))
-        if self is rook or isinstance(self, King):
-            if isinstance(rook, Rook) and not rook.has_moved:
 
-                path_locations = [(king.row, king.column-i-1) for i in range(3)
-                    if not self.model.get_piece((king.row, king.column-i-1))]
+class Piece(ABC):
+    '''
+    A piece on the board. Pieces keep their attributes in __slots__ rather than a __dict__,
+    every model copy creates a full set of them.
+    '''
 
-                if len(path_locations) == 3:
+    __slots__ = ("model", "color", "row", "column", "has_moved")
 
-                    if len(king.get_locations(path_locations, castling=True)) == 3:
+    def __init__(self, model, color, row, column):
+        self.model = model
+        self.color = color
+        self.row = row
+        self.column = column
+        self.has_moved = False
 
-                        if isinstance(self, King):
-                            castling_locations.append((rook.row, rook.column, -2))
-                        else:
-                            castling_locations.append((king.row, king.column, -2))
 
-        #Right rook
-        rook = self.model.get_piece((king.row, king.column+3))
-        if self is rook or isinstance(self, King):
-            if isinstance(rook, Rook) and not rook.has_moved:
+    def copy(self, model=None) -> 'Piece':
+        new_copy = type(self)(model, self.color, self.row, self.column)
+        new_copy.has_moved = self.has_moved
+        return new_copy
 
-                path_locations = [(king.row, king.column+i+1) for i in range(2)
-                    if not self.model.get_piece((king.row, king.column+i+1))]
 
-                if len(path_locations) == 2:
+    def get_moves(self) -> dict:
+        '''
+        Returns the legal moves of this piece keyed by the (row, column) location clicked to play them.
+        Castling is offered to both the king and the rook, at the other piece's location.
+        Promotions are offered once, as the queen promotion.
+        '''
+        square = self.row * 8 + self.column
+        moves = {}
+        for move in self.model.get_legal_moves():
+            from_square = move & 63
+            to_square = move >> 6 & 63
+            flags = move >> 12
+            if flags & PROMOTION and flags & 3 != QUEEN - 1: continue
 
-                    if len(king.get_locations(path_locations, castling=True)) == 2:
+            #Castling, the king is given the rook's location and the rook the king's
+            if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+                rook_square = to_square + 1 if flags == KING_CASTLE else to_square - 2
+                if from_square == square: moves[(rook_square >> 3, rook_square & 7)] = move
+                elif rook_square == square: moves[(from_square >> 3, from_square & 7)] = move
 
-                        if isinstance(self, King):
-                            castling_locations.append((rook.row, rook.column, 2))
-                        else:
-                            castling_locations.append((king.row, king.column, 2))
+            elif from_square == square:
+                moves[(to_square >> 3, to_square & 7)] = move
 
-        return castling_locations
+        return moves
 
 
 class Pawn(Piece):
 
-    def get_tentative(self) -> list:
-        '''
-        Returns a list of locations a piece can tentatively move to; list of tuple(row, column).
-        '''
-        tentative = []
-        step = 1 if self.color == BLACK else -1
-
-        #Add forward 1 step
-        loc = (self.row+step, self.column)
-        if self.in_board_range(loc):
-            piece = self.model.get_piece(loc)
-            if not piece:
-                tentative.append(loc)
-
-                #Add forward 2 steps
-                loc2 = (self.row+step*2, self.column)
-                if self.in_board_range(loc2):
-                    piece2 = self.model.get_piece(loc2)
-                    if not self.has_moved and not piece2: tentative.append(loc2)
-
-        #Add adjacent forward moves
-        locations = [(self.row+step, self.column-1), (self.row+step, self.column+1)]
-        for loc in locations:
-            if self.in_board_range(loc):
-                piece = self.model.get_piece(loc)
-                if piece and piece.color != self.color:
-                    tentative.append(loc)
-
-        return tentative
+    __slots__ = ()
+    kind = PAWN
 
 
 class Rook(Piece):
 
-    def get_tentative(self) -> list:
-        '''
-        Returns a list of locations a piece can tentatively move to; list of tuple(row, column).
-        '''
-        return self.get_linear_tentative([
-            [(self.row, self.column+i+1) for i in range(8) if self.in_board_range((self.row, self.column+i+1))],
-            [(self.row, self.column-i-1) for i in range(8) if self.in_board_range((self.row, self.column-i-1))],
-            [(self.row+i+1, self.column) for i in range(8) if self.in_board_range((self.row+i+1, self.column))],
-            [(self.row-i-1, self.column) for i in range(8) if self.in_board_range((self.row-i-1, self.column))]
-        ])
+    __slots__ = ()
+    kind = ROOK
 
 
 class Knight(Piece):
 
-    def get_tentative(self) -> list:
-        '''
-        Returns a list of locations a piece can tentatively move to; list of tuple(row, column).
-        '''
-        tentative = []
-        locations = [(2, -1), (2, 1), (1, -2), (1, 2), (-1, -2), (-1, 2), (-2, -1), (-2, 1)]
-        for i in locations:
-            loc = (self.row+i[0], self.column+i[1])
-            if self.in_board_range(loc):
-                piece = self.model.get_piece(loc)
-                if not piece or (piece and piece.color != self.color):
-                    tentative.append(loc)
-        return tentative
+    __slots__ = ()
+    kind = KNIGHT
 
 
 class Bishop(Piece):
 
-    def get_tentative(self) -> list:
-        '''
-        Returns a list of locations a piece can tentatively move to; list of tuple(row, column).
-        '''
-        return self.get_linear_tentative([
-            [(self.row-i-1, self.column+i+1) for i in range(8) if self.in_board_range((self.row-i-1, self.column+i+1))],
-            [(self.row+i+1, self.column+i+1) for i in range(8) if self.in_board_range((self.row+i+1, self.column+i+1))],
-            [(self.row+i+1, self.column-i-1) for i in range(8) if self.in_board_range((self.row+i+1, self.column-i-1))],
-            [(self.row-i-1, self.column-i-1) for i in range(8) if self.in_board_range((self.row-i-1, self.column-i-1))]
-        ])
+    __slots__ = ()
+    kind = BISHOP
 
 
 class Queen(Piece):
 
-    def get_tentative(self) -> list:
-        '''
-        Returns a list of locations a piece can tentatively move to; list of tuple(row, column).
-        '''
-        return self.get_linear_tentative([
-            [(self.row, self.column+i+1) for i in range(8) if self.in_board_range((self.row, self.column+i+1))],
-            [(self.row, self.column-i-1) for i in range(8) if self.in_board_range((self.row, self.column-i-1))],
-            [(self.row+i+1, self.column) for i in range(8) if self.in_board_range((self.row+i+1, self.column))],
-            [(self.row-i-1, self.column) for i in range(8) if self.in_board_range((self.row-i-1, self.column))],
-            [(self.row-i-1, self.column+i+1) for i in range(8) if self.in_board_range((self.row-i-1, self.column+i+1))],
-            [(self.row+i+1, self.column+i+1) for i in range(8) if self.in_board_range((self.row+i+1, self.column+i+1))],
-            [(self.row+i+1, self.column-i-1) for i in range(8) if self.in_board_range((self.row+i+1, self.column-i-1))],
-            [(self.row-i-1, self.column-i-1) for i in range(8) if self.in_board_range((self.row-i-1, self.column-i-1))]
-        ])
+    __slots__ = ()
+    kind = QUEEN
 
 
 class King(Piece):
 
-    def get_tentative(self) -> list:
-        '''
-        Returns a list of locations a piece can tentatively move to; list of tuple(row, column).
-        '''
-        tentative = []
-        for i in range(3):
-            for j in range(3):
-                loc = (self.row-1+i, self.column-1+j)
-                if i == 1 and j == 1 or not self.in_board_range(loc): continue
-                piece = self.model.get_piece(loc)
-                if not piece or piece and piece.color != self.color:
-                    tentative.append(loc)
-        return tentative
-
+    __slots__ = ()
+    kind = KING
 
     def in_check(self) -> bool:
         '''
-        Search all possible moves of all opposing pieces and see if they can attack the king.
+        Returns true if any opposing piece attacks the king's square.
         '''
-        for row in self.model.board:
-            for piece in row:
-                if not piece or piece is self or piece.color == self.color: continue
-                if (self.row, self.column) in piece.get_locations(first_call=False): return True
-        return False
+        return self.model.is_square_attacked((self.row, self.column), self.color ^ 1)
+
+
+PIECE_TYPES = [Pawn, Knight, Bishop, Rook, Queen, King]
@@ -1,8 +1,119 @@
+import selectors
 import socket
-from time import sleep
-from threading import Thread
+import struct
+import time
+from collections import deque
+from threading import Lock, Thread
 from Game.constants import *
 
+HEARTBEAT_INTERVAL = 2  #Seconds the link may be idle before a heartbeat is sent
+PEER_TIMEOUT = 10  #Seconds without hearing from the other host before the connection is dropped
+OUTBOUND_LIMIT = 256  #Frames that may wait to be sent before the connection is given up on
+
+#A frame is the length of its body, then the body: the instruction byte followed by its fields.
+#A trailing str argument is sent as UTF-8 text after the fixed fields.
+LENGTH = struct.Struct('>H')
+INSTRUCTION = struct.Struct('>B')
+MESSAGE_FIELDS = {
+    NetworkIns.HEARTBEAT.value: struct.Struct('>'),
+    NetworkIns.NEW_GAME.value: struct.Struct('>h'),  #Timer
+    NetworkIns.UPDATE_TIMER.value: struct.Struct('>h'),  #Timer
+    NetworkIns.MOVE_PIECE.value: struct.Struct('>hH'),  #Timer, packed move
+    NetworkIns.DECLARE_WINNER.value: struct.Struct('>hB'),  #Timer, winner's color, then the win condition text
+    NetworkIns.REJOINED_LOBBY.value: struct.Struct('>b'),  #In lobby 1 or 0, -1 asks the client
+    NetworkIns.ASSIGN_COLOR.value: struct.Struct('>B'),  #Color the client plays, sent by a game server
+}
+
+
+def encode_message(instruction, *args) -> bytes:
+    '''
+    Returns the frame for an instruction and its fields
+    '''
+    text = b""
+    if args and isinstance(args[-1], str):
+        text = args[-1].encode('utf-8')
+        args = args[:-1]
+    body = INSTRUCTION.pack(instruction) + MESSAGE_FIELDS[instruction].pack(*args) + text
+    return LENGTH.pack(len(body)) + body
+
+
+def decode_message(body) -> list:
+    '''
+    Returns [instruction, fields...] from the body of a frame. Raises ValueError for an unknown
+    instruction or a body too short for its fields.
+    '''
+    instruction = body[0]
+    if instruction not in MESSAGE_FIELDS: raise ValueError(f"Unknown instruction {instruction}")
+    fields = MESSAGE_FIELDS[instruction]
+    try: data = [instruction, *fields.unpack_from(body, INSTRUCTION.size)]
+    except struct.error as error: raise ValueError(str(error)) from None
+    text = body[INSTRUCTION.size + fields.size:]
+    if text: data.append(bytes(text).decode('utf-8'))
+    return data
+
+
+class FrameDecoder:
+    '''
+    Reassembles frames from a stream, where one read may hold part of a frame or several.
+    '''
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+
+    def feed(self, data) -> list:
+        '''
+        Add received bytes, returns the decoded messages of every frame now complete
+        '''
+        self.buffer += data
+        messages = []
+        start = 0
+        while len(self.buffer) - start >= LENGTH.size:
+            length, = LENGTH.unpack_from(self.buffer, start)
+            end = start + LENGTH.size + length
+            if length == 0: raise ValueError("Empty frame")
+            if end > len(self.buffer): break
+            messages.append(decode_message(self.buffer[start + LENGTH.size:end]))
+            start = end
+        del self.buffer[:start]
+        return messages
+
+
+class OutboundQueue:
+    '''
+    Bounded queue of frames waiting to be sent. Any thread may put frames in,
+    the connection thread takes everything queued at once to send in one go.
+    '''
+
+    def __init__(self, limit=OUTBOUND_LIMIT):
+        self.frames = deque()
+        self.limit = limit
+        self.lock = Lock()
+
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+
+    def put(self, frame) -> bool:
+        '''
+        Queue a frame, returns False without queueing it when the queue is full
+        '''
+        with self.lock:
+            if len(self.frames) >= self.limit: return False
+            self.frames.append(frame)
+            return True
+
+
+    def take_all(self) -> bytes:
+        '''
+        Remove every queued frame, returns them joined in the order they were put
+        '''
+        with self.lock:
+            data = b"".join(self.frames)
+            self.frames.clear()
+        return data
+
 
 class OnlinePlayer:
 
@@ -34,45 +145,168 @@ class OnlinePlayer:
 
     def send_as_bytes(self, *args):
         '''
-        Turn instructions into byte format so they can be sent across the network.
+        Turn instructions into a frame so they can be sent across the network.
         Then send instructions.
         '''
-        string = ""
-        for arg in args:
-            if isinstance(arg, tuple):
-                for i in arg:
-                    string += str(i) + ","
-            else:
-                string += str(arg) + ","
-        self.host.data_to_send = bytes(string[:-1], 'utf-8')
- 
+        self.host.send(encode_message(*args))
+
+
+    def send_heartbeat(self):
+        '''
+        Called by the host when nothing has been sent for a while. In a game the server
+        syncs the client's timer instead, which keeps the link alive just the same.
+        '''
+        if (isinstance(self.host, Server) and self.controller.win_color is None and
+        self.controller.view.active_frame == ActiveFrame.IN_GAME.value):
+            self.controller.send_ins(NetworkIns.UPDATE_TIMER.value)
+        else:
+            self.send_as_bytes(NetworkIns.HEARTBEAT.value)
+
+
+    def receive_ins(self, data):
+        '''
+        Hand a decoded instruction, [instruction, fields...], to the controller on the Tk thread.
+        Timer syncs still waiting to run are replaced by the latest one.
+        '''
+        if data[0] == NetworkIns.HEARTBEAT.value: return
+        key = "timer sync" if data[0] == NetworkIns.UPDATE_TIMER.value else None
+        self.controller.dispatcher.post(self.run_callback, self.execute_ins, data, key=key)
+
 
-    def receive_ins(self, byte_string):
+    def execute_ins(self, data):
         '''
-        Decode the receive byte string and tell controller to execute the instructions.
+        Tell controller to execute the instructions, on the Tk thread.
         '''
         self.receiving_instruction = True
-        data = byte_string.decode('utf-8').split(",")
-        for i in range(len(data)):
-            try: data[i] = int(data[i])
-            except: pass
-        if data[0] != 0:
-            self.controller.execute_instructions(data)
+        self.controller.execute_instructions(data)
         self.receiving_instruction = False
 
 
-class Server(Thread):
+    def dispatch(self, func, *args):
+        '''
+        Run a controller callback from the connection thread on the Tk thread
+        '''
+        self.controller.dispatcher.post(self.run_callback, func, *args)
 
-    def __init__(self, player, port):
+
+    def run_callback(self, func, *args):
+        '''
+        Callbacks still queued when the player disconnects are dropped
+        '''
+        if self.controller.online_player is self: func(*args)
+
+
+class Host(Thread):
+    '''
+    Connection thread shared by Server and Client. It waits on the connection and a wakeup
+    socket with a selector, so instructions go out as soon as they are sent and are handled
+    as soon as they arrive. Heartbeats are only sent while the link is otherwise idle.
+    '''
+
+    def __init__(self, player):
         self.player = player
+        self.outbound = OutboundQueue()
+        self.overflowed = False
+        self.socket_live = False
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        super().__init__(target=self.open_connection)
+
+
+    def send(self, frame):
+        '''
+        Queue a frame and wake the connection thread to send it. A peer that has stopped
+        reading fills the queue, and the connection is then dropped rather than lose frames.
+        '''
+        if not self.outbound.put(frame): self.overflowed = True
+        self.notify()
+
+
+    def notify(self):
+        '''
+        Wake the connection thread so it sends the queued frames now
+        '''
+        try: self.wakeup_send.send(b"\0")
+        except OSError: pass
+
+
+    def wait_readable(self, sock) -> bool:
+        '''
+        Block until sock can be read, returns False if the player disconnects first
+        '''
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            selector.register(self.wakeup_recv, selectors.EVENT_READ)
+            while not self.player.closing_connection:
+                for key, _ in selector.select():
+                    if key.fileobj is sock: return True
+                    self.wakeup_recv.recv(self.player.data_limit)
+        return False
+
+
+    def send_recv_data(self, conn):
+        '''
+        Send and receive data on conn until it closes, goes quiet, or the player disconnects.
+        conn is non-blocking and only waited on for writing while data is pending, so a peer
+        that stops reading can't stall the thread: the queue then overflows or the peer times out.
+        '''
+        decoder = FrameDecoder()
+        self.outbound.take_all()  #Nothing queued for an earlier connection is sent on this one
+        self.overflowed = False
+        pending = b""  #Taken from the queue but not yet accepted by the socket
+        events = selectors.EVENT_READ
+        last_sent = last_received = time.monotonic()
+        conn.setblocking(False)
+        with selectors.DefaultSelector() as selector:
+            selector.register(conn, events)
+            selector.register(self.wakeup_recv, selectors.EVENT_READ)
+            while not self.player.closing_connection:
+                try:
+                    if not pending: pending = self.outbound.take_all()
+                    wanted = selectors.EVENT_READ | (selectors.EVENT_WRITE if pending else 0)
+                    if wanted != events:
+                        events = wanted
+                        selector.modify(conn, events)
+
+                    timeout = min(last_sent + HEARTBEAT_INTERVAL, last_received + PEER_TIMEOUT) - time.monotonic()
+                    for key, mask in selector.select(max(0, timeout)):
+                        if key.fileobj is self.wakeup_recv:
+                            self.wakeup_recv.recv(self.player.data_limit)
+                            continue
+                        if mask & selectors.EVENT_WRITE and pending:
+                            pending = pending[conn.send(pending):]
+                            last_sent = time.monotonic()
+                        if mask & selectors.EVENT_READ:
+                            try: data = conn.recv(self.player.data_limit)
+                            except BlockingIOError: continue
+                            if not data: return
+                            last_received = time.monotonic()
+                            for message in decoder.feed(data):
+                                self.player.receive_ins(message)
+
+                    if self.overflowed: return
+                    if time.monotonic() - last_received >= PEER_TIMEOUT: return
+                    if not pending and len(self.outbound) == 0 and time.monotonic() - last_sent >= HEARTBEAT_INTERVAL:
+                        self.player.send_heartbeat()
+                except BlockingIOError:
+                    continue
+                except:
+                    return
+
+
+    def close_wakeup(self):
+        self.wakeup_recv.close()
+        self.wakeup_send.close()
+
+
+class Server(Host):
+
+    def __init__(self, player, port):
+        super().__init__(player)
         self.port = port
         self.server_ip = socket.gethostbyname(socket.gethostname())
         self.client_ip = ""
-        self.data_to_send = b""
         self.conn = None
         self.s = None
-        self.socket_live = False
-        super().__init__(target=self.open_connection)
         self.start()
 
 
@@ -86,54 +320,33 @@ class Server(Thread):
             self.s.listen()
 
             while True:
-                try: self.conn, addr = self.s.accept()
+                try:
+                    if not self.wait_readable(self.s): break
+                    self.conn, addr = self.s.accept()
                 except: break
                 self.client_ip = addr[0]
-                self.player.controller.server_join_status(True)
-                self.send_recv_data()
+                self.player.dispatch(self.player.controller.server_join_status, True)
+                with self.conn:
+                    self.send_recv_data(self.conn)
+                self.client_ip = ""
 
                 if not self.player.closing_connection:
-                    self.player.controller.server_join_status(False)
+                    self.player.dispatch(self.player.controller.server_join_status, False)
 
                 if self.player.controller.view.active_frame == ActiveFrame.IN_GAME.value:
                     break
         
         if not self.player.closing_connection:
-            self.player.controller.connection_ended()
+            self.player.dispatch(self.player.controller.connection_ended)
 
         self.socket_live = False
-            
-
-    def send_recv_data(self):
-        '''
-        Send and receive data every time interval 
-        '''
-        with self.conn:
-            while True:
-                try:
-                    if self.data_to_send:
-                        self.conn.sendall(self.data_to_send)
-                        self.data_to_send = b""
-                    elif (self.player.controller.view.active_frame == ActiveFrame.IN_GAME.value
-                    and self.player.controller.win_color is None):
-                        self.player.controller.send_ins(NetworkIns.UPDATE_TIMER.value)
-                        self.conn.sendall(self.data_to_send)
-                        self.data_to_send = b""
-                    else:
-                        self.conn.sendall(b"0")
-                    data = self.conn.recv(self.player.data_limit)
-                    if not data: break
-                    self.player.receive_ins(data)
-                    sleep(1)
-                except:
-                    break
-        self.client_ip = ""
         
 
     def close_connection(self):
         '''
         Gracefully close the server connection and thread
         '''
+        self.notify()
         if self.conn:
             self.conn.close()
         if self.s:
@@ -141,19 +354,17 @@ class Server(Thread):
             self.socket_live = False
         if self.is_alive():
             self.join()
+        self.close_wakeup()
 
 
-class Client(Thread):
+class Client(Host):
     
     def __init__(self, player, port, server_ip):
-        self.player = player
+        super().__init__(player)
         self.port = port
         self.server_ip = server_ip
         self.client_ip = socket.gethostbyname(socket.gethostname())
-        self.data_to_send = ""
         self.s = None
-        self.socket_live = False
-        super().__init__(target=self.open_connection)
         self.start()
 
 
@@ -165,43 +376,26 @@ class Client(Thread):
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as self.s:
             try:
                 self.s.connect((self.server_ip, self.port))
-                self.player.controller.client_join_status(True)
+                self.player.dispatch(self.player.controller.client_join_status, True)
             except:
-                self.player.controller.client_join_status(False)
+                self.player.dispatch(self.player.controller.client_join_status, False)
                 return
-            self.send_recv_data()
+            self.send_recv_data(self.s)
         
         if not self.player.closing_connection:
-            self.player.controller.connection_ended()
+            self.player.dispatch(self.player.controller.connection_ended)
         
         self.socket_live = False
 
 
-    def send_recv_data(self):
-        '''
-        Receive data, then instantly send data
-        '''
-        with self.s:
-            while True:
-                try:
-                    data = self.s.recv(self.player.data_limit)
-                    if not data: break
-                    self.player.receive_ins(data)
-                    if self.data_to_send:
-                        self.s.sendall(self.data_to_send)
-                        self.data_to_send = b""
-                    else:
-                        self.s.sendall(b"0")
-                except:
-                    break
-
-
     def close_connection(self):
         '''
         Gracefully close the client connection and thread
         '''
+        self.notify()
         if self.s:
             self.s.close()
             self.socket_live = False
         if self.is_alive():
             self.join()
+        self.close_wakeup()
@@ -0,0 +1,101 @@
+import argparse
+import time
+from Game.model import Model
+from Game.bitboard import Position, START_FEN, move_name
+from Game.mailbox import MailboxPosition
+
+#Standard perft positions and their known leaf counts for depth 1, 2, 3...
+PERFT_SUITE = [
+    ("Start position", START_FEN,
+        [20, 400, 8902, 197281, 4865609]),
+    ("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        [48, 2039, 97862, 4085603]),
+    ("Rook endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        [14, 191, 2812, 43238, 674624]),
+    ("Promotions", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        [6, 264, 9467, 422333]),
+    ("Promotions mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1",
+        [6, 264, 9467, 422333]),
+    ("Discovered checks", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        [44, 1486, 62379, 2103487]),
+    ("Middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        [46, 2079, 89890, 3894594])
+]
+
+
+def perft(model: Model, depth: int) -> int:
+    '''
+    Count the leaf nodes of the legal move tree to the given depth.
+    The last ply is counted from the move list without playing it.
+    '''
+    moves = model.get_legal_moves()
+    if depth <= 1: return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        model.make_move(move)
+        nodes += perft(model, depth - 1)
+        model.unmake_move()
+    return nodes
+
+
+def divide(model: Model, depth: int) -> list:
+    '''
+    Returns (move, leaf count) for every root move, the tool for finding which move a bug is under.
+    '''
+    counts = []
+    for move in model.get_legal_moves():
+        model.make_move(move)
+        counts.append((move, perft(model, depth - 1)))
+        model.unmake_move()
+    return counts
+
+
+def run_suite(max_nodes: int, position_type=Position) -> bool:
+    '''
+    Check every suite position at each depth whose known count is at most max_nodes.
+    Prints a line per check, returns true if every count matched.
+    '''
+    passed = True
+    for name, fen, counts in PERFT_SUITE:
+        model = Model(None, position_type)
+        model.load_fen(fen)
+        for depth, expected in enumerate(counts, 1):
+            if expected > max_nodes: break
+            start = time.perf_counter()
+            nodes = perft(model, depth)
+            seconds = time.perf_counter() - start
+            result = "ok" if nodes == expected else f"FAIL expected {expected}"
+            print(f"{name:<20} depth {depth}  {nodes:>9} nodes  {nodes / max(seconds, 1e-9):>9.0f} nps  {result}")
+            passed = passed and nodes == expected
+    return passed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Count leaf nodes of the legal move tree (perft).")
+    parser.add_argument("depth", type=int, nargs="?", default=3, help="plies to search (default 3)")
+    parser.add_argument("--fen", default=START_FEN, help="position to search (default the start position)")
+    parser.add_argument("--divide", action="store_true", help="print the leaf count under each root move")
+    parser.add_argument("--suite", action="store_true", help="check the standard perft positions instead")
+    parser.add_argument("--max-nodes", type=int, default=100000,
+        help="with --suite, skip depths whose known count is larger (default 100000)")
+    parser.add_argument("--mailbox", action="store_true", help="use the 10x12 mailbox core instead of bitboards")
+    args = parser.parse_args(argv)
+    position_type = MailboxPosition if args.mailbox else Position
+
+    if args.suite: return 0 if run_suite(args.max_nodes, position_type) else 1
+
+    model = Model(None, position_type)
+    model.load_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        nodes = 0
+        for move, count in divide(model, args.depth):
+            print(f"{move_name(move)}: {count}")
+            nodes += count
+    else:
+        nodes = perft(model, args.depth)
+    seconds = time.perf_counter() - start
+    print(f"Nodes: {nodes}")
+    print(f"Time: {seconds:.3f}s")
+    print(f"Nodes per second: {nodes / max(seconds, 1e-9):.0f}")
+    return 0
@@ -0,0 +1,493 @@
+import random
+import struct
+from abc import ABC, abstractmethod
+from array import array
+from Game.constants import *
+from Game.evaluation import *
+
+#Squares are numbered row * 8 + column, matching the Model's (row, column) locations.
+#Square 0 is black's queen side corner (a8), square 63 is white's king side corner (h1).
+
+#Castling rights that survive a piece leaving or arriving on a square
+CASTLING_MASKS = [15] * 64
+CASTLING_MASKS[0] = 15 & ~BLACK_QUEENSIDE
+CASTLING_MASKS[4] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[7] = 15 & ~BLACK_KINGSIDE
+CASTLING_MASKS[56] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASKS[60] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[63] = 15 & ~WHITE_KINGSIDE
+
+PROMOTIONS = (QUEEN, ROOK, BISHOP, KNIGHT)
+
+#Moves are packed into 16 bit ints: from square | to square << 6 | flags << 12
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EN_PASSANT = 5
+PROMOTION = 8  #Plus the promotion kind - 1, plus CAPTURE when the promotion captures
+CAPTURE_BIT = CAPTURE << 12  #Set in every capture, en passant and capturing promotions included
+PROMOTION_BIT = PROMOTION << 12  #Set in every promotion
+PROMOTION_KIND_BITS = 3 << 12  #The promotion kind - 1 of a promotion
+NO_MOVE = 0  #Never a legal move, a square can't move to itself
+
+#Zobrist keys, seeded so a position hashes the same in every process and every run
+_zobrist_random = random.Random(20230815)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for sq in range(64)] for code in range(12)]
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for rights in range(16)]
+ZOBRIST_EP = [_zobrist_random.getrandbits(64) for column in range(8)]
+ZOBRIST_BLACK = _zobrist_random.getrandbits(64)
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+FEN_PIECES = "pnbrqkPNBRQK"  #Indexed by piece code
+FEN_CASTLING = ((WHITE_KINGSIDE, "K"), (WHITE_QUEENSIDE, "Q"), (BLACK_KINGSIDE, "k"), (BLACK_QUEENSIDE, "q"))
+
+#Packed position: twelve bitboards, turn, castling, en passant square (64 for none), halfmove clock
+PACK_FORMAT = struct.Struct('<12QBBBH')
+
+
+def square(location) -> int:
+    '''
+    Convert a (row, column) location to a square index.
+    '''
+    return location[0] * 8 + location[1]
+
+
+def location(square) -> (int, int):
+    '''
+    Convert a square index to a (row, column) location.
+    '''
+    return (square >> 3, square & 7)
+
+
+def square_name(square) -> str:
+    '''
+    Returns the algebraic name of a square, 'a8' for square 0.
+    '''
+    return "abcdefgh"[square & 7] + str(8 - (square >> 3))
+
+
+def encode_move(from_square, to_square, flags=QUIET) -> int:
+    return from_square | to_square << 6 | flags << 12
+
+
+def move_promotion(move) -> int:
+    '''
+    Returns the kind a move promotes to, or 0.
+    '''
+    return (move >> 12 & 3) + 1 if move & PROMOTION_BIT else 0
+
+
+def with_promotion(move, kind) -> int:
+    '''
+    Returns the promotion move with the promotion kind replaced.
+    '''
+    return move & ~PROMOTION_KIND_BITS | (kind - 1) << 12
+
+
+def move_name(move) -> str:
+    '''
+    Returns a move in coordinate notation, 'e2e4' or 'e7e8q'.
+    '''
+    return square_name(move & 63) + square_name(move >> 6 & 63) + ("", "n", "b", "r", "q")[move_promotion(move)]
+
+
+class PieceList:
+    '''
+    Unordered list of items with constant time add, remove and replace. Every item's index is
+    kept in a dict, a removed item is overwritten by the last item instead of leaving a hole.
+    '''
+
+    __slots__ = ("items", "indexes")
+
+    def __init__(self, items=()):
+        self.items = []
+        self.indexes = {}
+        for item in items: self.add(item)
+
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+    def __contains__(self, item) -> bool:
+        return item in self.indexes
+
+
+    def add(self, item):
+        self.indexes[item] = len(self.items)
+        self.items.append(item)
+
+
+    def remove(self, item):
+        i = self.indexes.pop(item)
+        last = self.items.pop()
+        if last is not item:
+            self.items[i] = last
+            self.indexes[last] = i
+
+
+    def replace(self, item, new_item):
+        '''
+        Put new_item in the place of item.
+        '''
+        i = self.indexes.pop(item)
+        self.items[i] = new_item
+        self.indexes[new_item] = i
+
+
+class BasePosition(ABC):
+    '''
+    The part of a position core that does not depend on how the board is stored: side to move,
+    castling rights, the en passant square, the halfmove clock, the Zobrist key and the move history.
+    squares holds the piece code on every square, or None, so the piece on a square is a single lookup.
+    hash is the 64 bit Zobrist key of the position, kept up to date by every change made through
+    the methods below, and keys holds the keys of the positions earlier in the game.
+    mg_score, eg_score and phase are kept up to date the same way by put_piece and remove_piece,
+    so evaluate() never looks at the board. Moves are packed ints, see encode_move().
+
+    A core stores its board and generates moves by implementing put_piece, remove_piece,
+    is_square_attacked, king_square and generate_legal_moves.
+    '''
+
+    __slots__ = ("squares", "turn", "castling", "ep_square", "halfmove", "hash", "keys", "history",
+        "mg_score", "eg_score", "phase")
+
+    def __init__(self):
+        self.squares = [None] * 64
+        self.turn = WHITE
+        self.castling = 0
+        self.ep_square = None
+        self.halfmove = 0
+        self.hash = 0
+        self.keys = []
+        self.history = []
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+
+
+    def copy(self) -> 'BasePosition':
+        position = type(self)()
+        position.squares = self.squares[:]
+        position.turn = self.turn
+        position.castling = self.castling
+        position.ep_square = self.ep_square
+        position.halfmove = self.halfmove
+        position.hash = self.hash
+        position.keys = self.keys[:]
+        position.mg_score = self.mg_score
+        position.eg_score = self.eg_score
+        position.phase = self.phase
+        return position
+
+
+    def piece_bitboards(self) -> list:
+        '''
+        Returns a bitboard of the squares of every piece code.
+        '''
+        bitboards = [0] * 12
+        for sq, code in enumerate(self.squares):
+            if code is not None: bitboards[code] |= 1 << sq
+        return bitboards
+
+
+    def pack(self) -> bytes:
+        '''
+        Serialize the position to bytes: the fixed fields of PACK_FORMAT followed by the keys of
+        the earlier positions, so repetitions are still found by whoever unpacks it.
+        '''
+        ep_square = 64 if self.ep_square is None else self.ep_square
+        return (PACK_FORMAT.pack(*self.piece_bitboards(), self.turn, self.castling, ep_square, self.halfmove)
+            + array('Q', self.keys).tobytes())
+
+
+    @classmethod
+    def unpack(cls, data) -> 'BasePosition':
+        '''
+        Rebuild a position serialized with pack().
+        '''
+        fields = PACK_FORMAT.unpack_from(data)
+        position = cls()
+        for code in range(12):
+            bitboard = fields[code]
+            while bitboard:
+                bit = bitboard & -bitboard
+                bitboard ^= bit
+                position.put_piece(code, bit.bit_length() - 1)
+        position.turn, position.castling, ep_square, position.halfmove = fields[12:]
+        position.ep_square = None if ep_square == 64 else ep_square
+        position.hash = position.compute_hash()
+        position.keys = array('Q', data[PACK_FORMAT.size:]).tolist()
+        return position
+
+
+    @classmethod
+    def from_fen(cls, fen) -> 'BasePosition':
+        '''
+        Build a position from Forsyth-Edwards Notation. The move counters may be left off.
+        Raises ValueError for a malformed FEN.
+        '''
+        fields = fen.split()
+        if len(fields) < 4: raise ValueError(f"Expected at least 4 FEN fields: {fen}")
+        rows = fields[0].split("/")
+        if len(rows) != 8: raise ValueError(f"Expected 8 rows in FEN: {fen}")
+
+        position = cls()
+        for row, text in enumerate(rows):
+            column = 0
+            for char in text:
+                if char.isdigit():
+                    column += int(char)
+                    continue
+                if char not in FEN_PIECES or column > 7: raise ValueError(f"Bad FEN row '{text}'")
+                position.put_piece(FEN_PIECES.index(char), row * 8 + column)
+                column += 1
+            if column != 8: raise ValueError(f"Bad FEN row '{text}'")
+
+        if fields[1] not in ("w", "b"): raise ValueError(f"Bad FEN side to move '{fields[1]}'")
+        position.turn = WHITE if fields[1] == "w" else BLACK
+        for right, char in FEN_CASTLING:
+            if char in fields[2]: position.castling |= right
+        if fields[3] != "-":
+            position.ep_square = (8 - int(fields[3][1])) * 8 + "abcdefgh".index(fields[3][0])
+        if len(fields) > 4: position.halfmove = int(fields[4])
+        position.hash = position.compute_hash()
+        return position
+
+
+    def to_fen(self) -> str:
+        '''
+        Returns the position in Forsyth-Edwards Notation. Full moves are not tracked and read 1.
+        '''
+        rows = []
+        for row in range(8):
+            text = ""
+            empty = 0
+            for code in self.squares[row * 8:row * 8 + 8]:
+                if code is None:
+                    empty += 1
+                    continue
+                if empty: text += str(empty)
+                text += FEN_PIECES[code]
+                empty = 0
+            if empty: text += str(empty)
+            rows.append(text)
+        castling = "".join(char for right, char in FEN_CASTLING if self.castling & right) or "-"
+        ep_square = "-" if self.ep_square is None else square_name(self.ep_square)
+        return f"{'/'.join(rows)} {'w' if self.turn == WHITE else 'b'} {castling} {ep_square} {self.halfmove} 1"
+
+
+    def compute_hash(self) -> int:
+        '''
+        Compute the Zobrist key of the position from scratch.
+        '''
+        key = ZOBRIST_CASTLING[self.castling]
+        for sq in range(64):
+            if self.squares[sq] is not None: key ^= ZOBRIST_PIECES[self.squares[sq]][sq]
+        if self.ep_square is not None: key ^= ZOBRIST_EP[self.ep_square & 7]
+        if self.turn == BLACK: key ^= ZOBRIST_BLACK
+        return key
+
+
+    def is_repetition(self) -> bool:
+        '''
+        Returns true if the position already occurred since the last capture or pawn move.
+        Only positions with the same side to move, at least four plies back, can match.
+        '''
+        keys = self.keys
+        for i in range(len(keys) - 4, max(len(keys) - self.halfmove, 0) - 1, -2):
+            if keys[i] == self.hash: return True
+        return False
+
+
+    def evaluate(self) -> int:
+        '''
+        Returns the score of the position in centipawns, positive when white is ahead. The middlegame
+        and endgame scores are blended by the phase, how much of the pieces are left on the board.
+        '''
+        phase = min(self.phase, MAX_PHASE)
+        return (self.mg_score * phase + self.eg_score * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+    @abstractmethod
+    def put_piece(self, code, square):
+        '''
+        Place the piece code on an empty square.
+        '''
+        pass
+
+
+    @abstractmethod
+    def remove_piece(self, square) -> int:
+        '''
+        Remove and return the piece code on the given square.
+        '''
+        pass
+
+
+    def make_move(self, move):
+        '''
+        Play a move from generate_legal_moves() and pass the turn. The state the move destroys is
+        pushed onto history as (move, captured code, castling, en passant square, halfmove clock, hash).
+        '''
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        flags = move >> 12
+        code = self.squares[from_square]
+        captured = self.squares[to_square]
+        self.history.append((move, captured, self.castling, self.ep_square, self.halfmove, self.hash))
+        self.keys.append(self.hash)
+        self.halfmove = 0 if captured is not None or code % 6 == PAWN else self.halfmove + 1
+
+        if captured is not None: self.remove_piece(to_square)
+        self.remove_piece(from_square)
+        self.put_piece(self.turn * 6 + (flags & 3) + 1 if flags & PROMOTION else code, to_square)
+
+        ep_square = None
+        if flags == DOUBLE_PUSH: ep_square = (from_square + to_square) // 2
+        elif flags == EN_PASSANT: self.remove_piece(to_square + (8 if self.turn == WHITE else -8))
+
+        #Castling, bring the rook to the other side of the king
+        elif flags == KING_CASTLE: self.put_piece(self.remove_piece(to_square + 1), to_square - 1)
+        elif flags == QUEEN_CASTLE: self.put_piece(self.remove_piece(to_square - 2), to_square + 1)
+
+        self.update_castling(from_square, to_square)
+        self.set_ep_square(ep_square)
+        self.pass_turn()
+
+
+    def unmake_move(self):
+        '''
+        Take back the last move played with make_move().
+        '''
+        move, captured, self.castling, self.ep_square, self.halfmove, key = self.history.pop()
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        flags = move >> 12
+        self.keys.pop()
+        self.turn ^= 1
+
+        code = self.remove_piece(to_square)
+        if flags & PROMOTION: code = self.turn * 6 + PAWN
+        self.put_piece(code, from_square)
+        if captured is not None: self.put_piece(captured, to_square)
+
+        if flags == EN_PASSANT:
+            self.put_piece((self.turn ^ 1) * 6 + PAWN, to_square + (8 if self.turn == WHITE else -8))
+        elif flags == KING_CASTLE: self.put_piece(self.remove_piece(to_square - 1), to_square + 1)
+        elif flags == QUEEN_CASTLE: self.put_piece(self.remove_piece(to_square + 1), to_square - 2)
+        self.hash = key
+
+
+    def update_castling(self, from_square, to_square):
+        '''
+        Drop the castling rights lost by a piece leaving from_square or landing on to_square.
+        '''
+        castling = self.castling & CASTLING_MASKS[from_square] & CASTLING_MASKS[to_square]
+        if castling != self.castling:
+            self.hash ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling]
+            self.castling = castling
+
+
+    def set_ep_square(self, square):
+        '''
+        Set the square a pawn can be taken en passant on, or None.
+        '''
+        if self.ep_square is not None: self.hash ^= ZOBRIST_EP[self.ep_square & 7]
+        if square is not None: self.hash ^= ZOBRIST_EP[square & 7]
+        self.ep_square = square
+
+
+    def pass_turn(self):
+        self.turn ^= 1
+        self.hash ^= ZOBRIST_BLACK
+
+
+    @abstractmethod
+    def occupied(self) -> int:
+        '''
+        Returns a bitboard of every occupied square.
+        '''
+        pass
+
+
+    @abstractmethod
+    def attackers(self, square, by_color, occupied) -> int:
+        '''
+        Returns a bitboard of the pieces of by_color attacking the square, sliders see through
+        anything missing from occupied.
+        '''
+        pass
+
+
+    def see(self, move) -> int:
+        '''
+        Static exchange evaluation of a capture: the material the side to move wins (in SEE_VALUES)
+        when both sides keep recapturing on the target square with their least valuable attacker,
+        each free to stop once recapturing would lose. Pieces behind a capturer join in as it leaves.
+        '''
+        from_square = move & 63
+        to_square = move >> 6 & 63
+        squares = self.squares
+        captured = squares[to_square]
+        occupied = self.occupied()
+        if move >> 12 == EN_PASSANT:
+            captured = (self.turn ^ 1) * 6 + PAWN
+            occupied ^= 1 << (to_square + (8 if self.turn == WHITE else -8))
+
+        #gain[i] is what the side making the i-th capture has won if the exchange stops there
+        gain = [0 if captured is None else SEE_VALUES[captured % 6]]
+        attacker = from_square
+        color = self.turn
+        while True:
+            gain.append(SEE_VALUES[squares[attacker] % 6] - gain[-1])
+            if max(-gain[-2], gain[-1]) < 0: break
+            occupied ^= 1 << attacker
+            color ^= 1
+
+            #Least valuable attacker left for the side to recapture
+            attackers = self.attackers(to_square, color, occupied) & occupied
+            if not attackers: break
+            attacker = None
+            while attackers:
+                bit = attackers & -attackers
+                attackers ^= bit
+                sq = bit.bit_length() - 1
+                if attacker is None or squares[sq] % 6 < squares[attacker] % 6: attacker = sq
+
+        for i in range(len(gain) - 2, 0, -1): gain[i - 1] = -max(-gain[i - 1], gain[i])
+        return gain[0]
+
+
+    @abstractmethod
+    def is_square_attacked(self, square, by_color) -> bool:
+        '''
+        Returns true if a piece of by_color attacks the square.
+        '''
+        pass
+
+
+    @abstractmethod
+    def king_square(self, color) -> int:
+        pass
+
+
+    def in_check(self) -> bool:
+        '''
+        Returns true if the side to move is in check.
+        '''
+        return self.is_square_attacked(self.king_square(self.turn), self.turn ^ 1)
+
+
+    @abstractmethod
+    def generate_legal_moves(self) -> list:
+        '''
+        Returns every legal move for the side to move.
+        '''
+        pass
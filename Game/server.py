@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import sys
+import time
+from Game.model import Model
+from Game.network import *
+
+TIME_LIMIT = 93  #Seconds per turn, the same as a hosting player's timer including its buffer
+TICK = 0.5  #Seconds between checks for timeouts and idle connections
+WRITE_BUFFER_LIMIT = 16 * 1024  #Bytes waiting to be sent to a player before the player is dropped, like OUTBOUND_LIMIT
+
+
+class Session:
+    '''
+    A player connected to the game server, in the lobby or in a game.
+    '''
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        self.game = None
+        self.color = None
+        self.last_sent = time.monotonic()
+
+
+    def send(self, *args):
+        '''
+        Send one instruction, buffered by the stream until the event loop can write it.
+        A player that has stopped reading is dropped once the buffer passes WRITE_BUFFER_LIMIT,
+        so one stalled connection can't grow the server's memory without bound.
+        '''
+        if self.writer.is_closing(): return
+        transport = self.writer.transport
+        if transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+            transport.abort()  #The connection's reader sees it close and the player leaves
+            return
+        self.writer.write(encode_message(*args))
+        self.last_sent = time.monotonic()
+
+
+class ServerGame:
+    '''
+    A game between two sessions. Moves are checked against a headless Model
+    before they are relayed, and the server keeps the turn timer.
+    '''
+
+    def __init__(self, white, black):
+        self.model = Model()
+        self.model.new_game()
+        self.players = {WHITE: white, BLACK: black}
+        self.turn_start = time.monotonic()
+        self.over = False
+        for color, session in self.players.items():
+            session.game = self
+            session.color = color
+
+
+    def start(self):
+        for color, session in self.players.items():
+            session.send(NetworkIns.ASSIGN_COLOR.value, color)
+            session.send(NetworkIns.NEW_GAME.value, 0)
+
+
+    def elapsed(self) -> int:
+        '''
+        Whole seconds the player to move has used
+        '''
+        return int(time.monotonic() - self.turn_start)
+
+
+    def opponent(self, session) -> Session:
+        return self.players[WHITE if session.color == BLACK else BLACK]
+
+
+    def play(self, session, move):
+        '''
+        Play a move sent by session and relay it to the opponent. A move out of turn or
+        not legal in the position loses the game.
+        '''
+        if self.over: return
+        if session.color != self.model.turn or move not in self.model.get_legal_moves():
+            self.finish(self.opponent(session).color, "Illegal move")
+            return
+        timer = self.elapsed()
+        self.model.move_piece(move)
+        self.turn_start = time.monotonic()
+        self.opponent(session).send(NetworkIns.MOVE_PIECE.value, timer, move)
+
+        #Both players see checkmate and stalemate on their own boards
+        self.model.check_game_over()
+        if self.model.result is not None: self.over = True
+
+
+    def finish(self, winner, win_con):
+        '''
+        End the game and tell both players who won and why
+        '''
+        self.over = True
+        for session in self.players.values():
+            session.send(NetworkIns.DECLARE_WINNER.value, self.elapsed(), winner, win_con)
+
+
+class GameServer:
+    '''
+    Headless server for many games at once. Players connect as clients, are paired
+    in the order they arrive, the first playing white, and are paired again when
+    they return to the lobby after a game.
+    '''
+
+    def __init__(self, time_limit=TIME_LIMIT):
+        self.time_limit = time_limit
+        self.sessions = set()
+        self.waiting = []
+        self.games = set()
+
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving games on {', '.join(str(s.getsockname()) for s in server.sockets)}")
+        ticker = asyncio.create_task(self.tick())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            ticker.cancel()
+
+
+    async def handle_connection(self, reader, writer):
+        '''
+        Read a player's instructions until they disconnect or go quiet
+        '''
+        session = Session(reader, writer)
+        self.sessions.add(session)
+        self.join_lobby(session)
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = await asyncio.wait_for(reader.read(4096), PEER_TIMEOUT)
+                if not data: break
+                for message in decoder.feed(data):
+                    self.execute_instructions(session, message)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.leave(session)
+            writer.close()
+
+
+    def execute_instructions(self, session, data):
+        '''
+        Execute an instruction from a player. Timers and results come from the server,
+        so only moves and returning to the lobby are acted on.
+        '''
+        if data[0] == NetworkIns.MOVE_PIECE.value:
+            if session.game is not None: session.game.play(session, data[2])
+
+        elif data[0] == NetworkIns.REJOINED_LOBBY.value and data[1] == 1:
+            if session.game is None or session.game.over: self.join_lobby(session)
+
+
+    def join_lobby(self, session):
+        '''
+        Queue a player for the next game, starting it once someone else is waiting
+        '''
+        self.end_game(session.game)
+        if session in self.waiting: return
+        self.waiting.append(session)
+        if len(self.waiting) >= 2:
+            game = ServerGame(self.waiting.pop(0), self.waiting.pop(0))
+            self.games.add(game)
+            game.start()
+
+
+    def leave(self, session):
+        '''
+        Forget a player that disconnected, their opponent wins a game in progress
+        '''
+        self.sessions.discard(session)
+        if session in self.waiting: self.waiting.remove(session)
+        game = session.game
+        if game is not None and not game.over: game.finish(game.opponent(session).color, "Disconnected")
+        self.end_game(game)
+
+
+    def end_game(self, game):
+        '''
+        Release a game once it is over and its players have moved on
+        '''
+        if game is None or not game.over: return
+        self.games.discard(game)
+        for session in game.players.values():
+            if session.game is game: session.game = None
+
+
+    async def tick(self):
+        '''
+        Call timeouts on turns and keep idle connections alive, the connected players
+        get a timer sync in a game and a heartbeat otherwise
+        '''
+        while True:
+            await asyncio.sleep(TICK)
+            now = time.monotonic()
+            for game in list(self.games):
+                if not game.over and now - game.turn_start >= self.time_limit:
+                    game.finish(WHITE if game.model.turn == BLACK else BLACK, "Timer")
+
+            for session in self.sessions:
+                if now - session.last_sent < HEARTBEAT_INTERVAL: continue
+                if session.game is not None and not session.game.over:
+                    session.send(NetworkIns.UPDATE_TIMER.value, session.game.elapsed())
+                else:
+                    session.send(NetworkIns.HEARTBEAT.value)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Host online games for players who join as clients.")
+    parser.add_argument("--host", default="0.0.0.0", help="address to listen on")
+    parser.add_argument("--port", type=int, default=50000, help="port to listen on (default 50000)")
+    parser.add_argument("--time-limit", type=int, default=TIME_LIMIT, help=f"seconds per turn (default {TIME_LIMIT})")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(GameServer(args.time_limit).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -86,8 +86,10 @@ class Timer(Thread):
         Reset the timer's interval to 0. New parameters may be assigned 
         here for the function called every interval.
         timer is paused on reset, must call resume()
+        The interval reads 0 as soon as this returns, the loop restarts its wait on its next check.
         '''
         self.reset_loop = True
+        self.curent_interval = 0
         if new_args: self.func_args = new_args
         self.pause_timer = True
 
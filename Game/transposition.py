@@ -0,0 +1,62 @@
+from array import array
+
+#Bound types, what a stored value says about the true value of the position
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+class TranspositionTable:
+    '''
+    Fixed size table of search results keyed by a position's Zobrist hash. The table is split
+    into buckets of two slots: the first keeps the result searched deepest (depth-preferred),
+    the second always takes the newest result that did not replace the first (always-replace).
+    Every field lives in its own preallocated array so the table never allocates while searching.
+
+    size is the number of entries and is rounded down to a power of two, at least 2.
+    '''
+
+    def __init__(self, size):
+        buckets = 1
+        while buckets * 4 <= size: buckets *= 2
+        self.size = buckets * 2
+        self.mask = buckets - 1
+        self.keys = array('Q', bytes(8 * self.size))
+        self.depths = array('b', [-1]) * self.size
+        self.values = array('d', bytes(8 * self.size))
+        self.flags = array('B', bytes(self.size))
+        self.moves = array('H', bytes(2 * self.size))  #Packed moves, 0 for none
+
+
+    def clear(self):
+        '''
+        Empty every slot of the table.
+        '''
+        for i in range(self.size):
+            self.depths[i] = -1
+            self.moves[i] = 0
+
+
+    def probe(self, key) -> tuple:
+        '''
+        Returns (depth, value, flag, best move) stored for the key, or None.
+        '''
+        i = (key & self.mask) << 1
+        if self.keys[i] != key or self.depths[i] < 0:
+            i += 1
+            if self.keys[i] != key or self.depths[i] < 0: return None
+        return self.depths[i], self.values[i], self.flags[i], self.moves[i]
+
+
+    def store(self, key, depth, value, flag, move):
+        '''
+        Store a search result. It takes the depth-preferred slot when it is searched at least as
+        deep as the result there, or is for the same position, otherwise the always-replace slot.
+        '''
+        i = (key & self.mask) << 1
+        if depth < self.depths[i] and self.keys[i] != key: i += 1
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.values[i] = value
+        self.flags[i] = flag
+        self.moves[i] = move
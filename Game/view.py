@@ -10,6 +10,7 @@ BOARD_COLOR_2 = "#412614"
 TURN_BORDER_COLOR = "white"
 WARNING_COLOR = "red"
 ASSESTS_PATH  = "Assets/"
+DISPATCH_INTERVAL = 20  #Milliseconds between runs of the calls other threads dispatch to the GUI
 
 
 class App(tk.Tk):
@@ -110,9 +111,18 @@ class App(tk.Tk):
         '''
         self.controller.timer.start()
         self.controller.timer.pause()
+        self.after(DISPATCH_INTERVAL, self.drain_dispatched)
         self.mainloop()
 
 
+    def drain_dispatched(self):
+        '''
+        Run the calls the network, timer, and AI threads have dispatched since the last drain
+        '''
+        try: self.controller.dispatcher.drain()
+        finally: self.after(DISPATCH_INTERVAL, self.drain_dispatched)
+
+
     def close(self):
         '''
         Closes the app
@@ -120,6 +130,7 @@ class App(tk.Tk):
         self.closing_app = True
         self.controller.timer.cancel() #This should be called first because timer calls gui functions
         self.controller.close_connections()
+        self.controller.agent.close()
         self.destroy()
 
 